@@ -1,54 +1,540 @@
-from bs4 import BeautifulSoup
-import requests
 import json
-import sys
-from collections import defaultdict, Counter
-import arrow
+from collections import defaultdict, Counter, OrderedDict
 import string
-import webcolors
 import re
-import cv2
 import numpy as np
 import os
-import shutil
+import time
+import hashlib
+import bz2
+import zlib
+import pickle
+import sqlite3
+import tempfile
+import argparse
+import threading
+import queue
+import heapq
+import importlib
+import cProfile
+import pstats
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlparse, urlencode, unquote, quote, parse_qs
 from itertools import chain
-from tnormaliser import StringNormalizer
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
 
 from abc import ABCMeta, abstractmethod
 
-tn = StringNormalizer(remove_stopwords=True, remove_punctuation=True, 
+class LazyModule:
+
+	'''
+	stands in for a module and only imports it when one of its attributes is first used, 
+	so that runs not needing, say, opencv don't pay for importing it
+	'''
+
+	def __init__(self, name):
+
+		self._name = name
+		self._module = None
+
+	def __getattr__(self, attr):
+
+		if self._module is None:
+			self._module = importlib.import_module(self._name)
+
+		return getattr(self._module, attr)
+
+bs4 = LazyModule('bs4')
+lxml_html = LazyModule('lxml.html')
+lxml_etree = LazyModule('lxml.etree')
+requests = LazyModule('requests')
+urllib3_exceptions = LazyModule('urllib3.exceptions')
+arrow = LazyModule('arrow')
+webcolors = LazyModule('webcolors')
+cv2 = LazyModule('cv2')
+
+def _atomic_write(path, data, mode='wb'):
+
+	'''
+	write data to a temporary file next to path and then move it to path, so that readers (concurrent runs, 
+	a merge) never see a half-written file; the directory is made if needed and the temporary file removed 
+	if anything goes wrong
+	'''
+
+	if not os.path.isdir(os.path.dirname(path) or '.'):
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+
+	fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+
+	try:
+		with os.fdopen(fd, mode) as f:
+			f.write(data)
+		os.replace(tmp_path, path)
+	except BaseException:
+		try:
+			os.remove(tmp_path)
+		except OSError:
+			pass
+		raise
+
+class LazyNormaliser:
+
+	'''
+	a StringNormalizer that is only configured when first used
+	'''
+
+	def __init__(self, **options):
+
+		self.options = options
+		self._tn = None
+
+	def normalise(self, st):
+
+		if self._tn is None:
+			from tnormaliser import StringNormalizer
+			self._tn = StringNormalizer(**self.options)
+
+		return self._tn.normalise(st)
+
+class NormaliserCache:
+
+	'''
+	bounded LRU cache in front of normaliser.normalise() that counts hits, misses and evictions; it's safe to use 
+	from many threads, forked processes get their own copy and it can be saved to disk and loaded on the next run
+	'''
+
+	def __init__(self, normaliser, maxsize=200000):
+
+		self.normaliser = normaliser
+		self.maxsize = maxsize
+
+		self._cache = OrderedDict()    # {string: normalised string,..}, most recently used last
+		self._lock = threading.Lock()
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def normalise(self, st):
+
+		with self._lock:
+			if st in self._cache:
+				self._cache.move_to_end(st)
+				self.hits += 1
+				return self._cache[st]
+			self.misses += 1
+
+		# normalise outside of the lock so that other threads aren't held up
+		st_norm = self.normaliser.normalise(st)
+
+		with self._lock:
+
+			self._cache[st] = st_norm
+
+			if len(self._cache) > self.maxsize:
+				self._cache.popitem(last=False)
+				self.evictions += 1
+
+		return st_norm
+
+	def stats(self):
+
+		return {'size': len(self._cache), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses, 
+					'evictions': self.evictions, 'hit_rate': self.hits/max(1, self.hits + self.misses)}
+
+	def _signature(self):
+
+		# saved entries are only good for a normaliser configured the same way
+		return json.dumps(getattr(self.normaliser, 'options', None), sort_keys=True)
+
+	def load(self, path):
+
+		try:
+			saved = pickle.load(open(path, 'rb'))
+		except (OSError, EOFError, pickle.UnpicklingError):
+			return self
+
+		if saved.get('signature') == self._signature():
+			with self._lock:
+				for st, st_norm in saved['entries'][-self.maxsize:]:
+					self._cache.setdefault(st, st_norm)
+
+		return self
+
+	def save(self, path):
+
+		with self._lock:
+			entries = list(self._cache.items())
+
+		_atomic_write(path, pickle.dumps({'signature': self._signature(), 'entries': entries}, protocol=pickle.HIGHEST_PROTOCOL))
+
+		return self
+
+tn = NormaliserCache(LazyNormaliser(remove_stopwords=True, remove_punctuation=True, 
 						lowercase=True, short_state_names=True, 
 							full_city_names=True, remove_nonalnum=True, disamb_country_names=True,
 								ints_to_words=False, year_to_label=False, remove_dupl_subsrings=True, max_dupl=4,
-									remove_dupl_words=False)
+									remove_dupl_words=False))
+
+class Metrics:
+
+	'''
+	timings and counters collected over a run: wall and cpu time of stages, teams, page parsing and reference 
+	lookups, every http request and cache hits and misses; exported as a json run report or in Prometheus text format. 
+	cpu time is that of the thread doing the work, other threads of a pipeline don't count
+	'''
+
+	# labels naming single pages or teams, which there can be thousands of; Prometheus gets totals over them, 
+	# the json report has the details
+	PER_ITEM_LABELS = ('url', 'venue', 'team')
+
+	def __init__(self):
+
+		self.timings = defaultdict(lambda: {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'max_wall': 0.0})    # {(name, labels): totals,..}
+		self.counters = defaultdict(int)    # {(name, labels): count,..}
+		self.requests = []    # one dict per http request
+
+		# stage to run under cProfile, if any, with a profiler for each thread running it
+		self.profile_stage = None
+		self._profilers = {}    # {thread id: cProfile.Profile,..}
+
+		self.started = time.time()
+		self._lock = threading.Lock()
+
+	@staticmethod
+	def _key(name, labels):
+
+		return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+	def observe(self, name, wall, cpu=0.0, **labels):
+
+		with self._lock:
+			t = self.timings[self._key(name, labels)]
+			t['count'] += 1
+			t['wall'] += wall
+			t['cpu'] += cpu
+			t['max_wall'] = max(t['max_wall'], wall)
+
+	@contextmanager
+	def timer(self, name, **labels):
+
+		wall, cpu = time.perf_counter(), time.thread_time()
+
+		try:
+			yield
+		finally:
+			self.observe(name, time.perf_counter() - wall, time.thread_time() - cpu, **labels)
+
+	def count(self, name, n=1, **labels):
+
+		with self._lock:
+			self.counters[self._key(name, labels)] += n
+
+	def request(self, url, status, size, seconds):
+
+		with self._lock:
+			self.requests.append({'url': url, 'host': urlparse(url).netloc, 'status': status, 'bytes': size, 'seconds': seconds})
+
+	@contextmanager
+	def stage(self, name):
+
+		'''
+		times a stage (or a stage's work on one team); the stage named in profile_stage also runs under cProfile. 
+		a profiler can't be shared between threads, so each thread running the stage gets its own and 
+		dump_profile merges them
+		'''
+
+		profiler = None
+
+		if name == self.profile_stage:
+			with self._lock:
+				if threading.get_ident() not in self._profilers:
+					self._profilers[threading.get_ident()] = cProfile.Profile()
+				profiler = self._profilers[threading.get_ident()]
+			profiler.enable()
+
+		try:
+			with self.timer('stage', stage=name):
+				yield
+		finally:
+			if profiler:
+				profiler.disable()
+
+	def dump_profile(self):
+
+		'''
+		save the profile of profile_stage to profile-<stage>.prof and print the top functions
+		'''
+
+		if self._profilers:
+			stats = pstats.Stats(*self._profilers.values())
+			stats.dump_stats(f'profile-{self.profile_stage}.prof')
+			stats.sort_stats('cumulative').print_stats(25)
+
+	def hit_rates(self):
+
+		'''
+		{cache: {result: count,.., 'hit_rate': share of hits},..} for the counters with a result label
+		'''
+
+		caches = defaultdict(dict)
+
+		with self._lock:
+			for (name, labels), n in self.counters.items():
+				if dict(labels).get('result'):
+					caches[name][dict(labels)['result']] = caches[name].get(dict(labels)['result'], 0) + n
+
+		st = tn.stats()
+		caches['normaliser_cache'] = {'hit': st['hits'], 'miss': st['misses'], 'eviction': st['evictions']}
+
+		for c in caches.values():
+			c['hit_rate'] = c.get('hit', 0)/max(1, sum(n for r, n in c.items() if r != 'eviction'))
+
+		return dict(caches)
+
+	def report(self):
+
+		with self._lock:
+			timings = [{'name': name, **dict(labels), **t} for (name, labels), t in sorted(self.timings.items())]
+			counters = [{'name': name, **dict(labels), 'count': n} for (name, labels), n in sorted(self.counters.items())]
+			requests = list(self.requests)
+
+		teams = defaultdict(lambda: {'wall': 0.0, 'cpu': 0.0})
+
+		for t in timings:
+			if 'team' in t:
+				teams[t['team']]['wall'] += t['wall']
+				teams[t['team']]['cpu'] += t['cpu']
+
+		hosts = defaultdict(lambda: {'requests': 0, 'bytes': 0, 'seconds': 0.0, 'statuses': Counter()})
+
+		for r in requests:
+			hosts[r['host']]['requests'] += 1
+			hosts[r['host']]['bytes'] += r['bytes']
+			hosts[r['host']]['seconds'] += r['seconds']
+			hosts[r['host']]['statuses'][str(r['status'])] += 1
+
+		return {'started': self.started, 'finished': time.time(), 
+					'stages': [t for t in timings if t['name'] == 'stage'], 'teams': dict(teams), 
+						'http': dict(hosts), 'cache_hit_rates': self.hit_rates(), 
+							'timings': timings, 'counters': counters, 'requests': requests}
+
+	def prometheus(self, prefix='austeams'):
+
+		def fmt(labels):
+			if not labels:
+				return ''
+			return '{' + ','.join(k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' 
+									for k, v in labels) + '}'
+
+		lines = []
+
+		with self._lock:
+			timings = sorted(self.timings.items())
+			counters = sorted(self.counters.items())
+			requests = list(self.requests)
+
+		totals = defaultdict(lambda: {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+
+		for (name, labels), t in timings:
+			total = totals[(name, tuple((k, v) for k, v in labels if k not in self.PER_ITEM_LABELS))]
+			for field in total:
+				total[field] += t[field]
+
+		timings = sorted(totals.items())
+
+		for name in dict.fromkeys(n for (n, _), _ in timings):
+			for kind, field in [('seconds', 'wall'), ('cpu_seconds', 'cpu')]:
+				lines.append(f'# TYPE {prefix}_{name}_{kind} summary')
+				for (n, labels), t in timings:
+					if n == name:
+						lines.append(f'{prefix}_{name}_{kind}_sum{fmt(labels)} {t[field]}')
+						lines.append(f'{prefix}_{name}_{kind}_count{fmt(labels)} {t["count"]}')
+
+		for name in dict.fromkeys(n for (n, _), _ in counters):
+			lines.append(f'# TYPE {prefix}_{name}_total counter')
+			for (n, labels), c in counters:
+				if n == name:
+					lines.append(f'{prefix}_{name}_total{fmt(labels)} {c}')
+
+		st = tn.stats()
+		lines.append(f'# TYPE {prefix}_normaliser_cache_total counter')
+		lines += [f'{prefix}_normaliser_cache_total{fmt([("result", r)])} {st[k]}' for r, k in [('hit', 'hits'), ('miss', 'misses'), ('eviction', 'evictions')]]
+
+		# per host and status; per url details are in the json report
+		by_status = Counter((r['host'], str(r['status'])) for r in requests)
+		by_host = defaultdict(lambda: [0, 0.0, 0])
+
+		for r in requests:
+			by_host[r['host']][0] += 1
+			by_host[r['host']][1] += r['seconds']
+			by_host[r['host']][2] += r['bytes']
+
+		lines.append(f'# TYPE {prefix}_http_requests_total counter')
+		lines += [f'{prefix}_http_requests_total{fmt([("host", h), ("status", st)])} {n}' for (h, st), n in sorted(by_status.items())]
+		lines.append(f'# TYPE {prefix}_http_request_seconds summary')
+		for h, (n, sec, _) in sorted(by_host.items()):
+			lines.append(f'{prefix}_http_request_seconds_sum{fmt([("host", h)])} {sec}')
+			lines.append(f'{prefix}_http_request_seconds_count{fmt([("host", h)])} {n}')
+		lines.append(f'# TYPE {prefix}_http_response_bytes_total counter')
+		lines += [f'{prefix}_http_response_bytes_total{fmt([("host", h)])} {b}' for h, (_, _, b) in sorted(by_host.items())]
+
+		return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
 
 class TEGCodeFinder:
 	
-	def __init__(self):
-		
-		self.AUS_SUBURBS = json.load(open('/Users/ik/Data/suburbs-and-postcodes/aus_suburbs_auspost_APR2017.json', 'r'))
-		self.TEG_VENUES = json.load(open('../temp_venue_match/teg_venues_anz.json'))
-		self.STATES_AND_REGIONS = {s['state'] for l in self.AUS_SUBURBS for s in self.AUS_SUBURBS[l]} | {v['state'] for v in self.TEG_VENUES}
-		
+	# bump when the compiled form changes
+	COMPILED_VERSION = 2
+
+	def __init__(self, suburbs_path='/Users/ik/Data/suburbs-and-postcodes/aus_suburbs_auspost_APR2017.json', 
+					teg_venues_path='../temp_venue_match/teg_venues_anz.json', compiled_path='data_cache/teg-reference.pickle'):
+
+		'''
+		the suburb and TEG venue files are compiled (normalised, indexed) once and pickled to compiled_path; 
+		later runs just unpickle that unless either source file has changed
+		'''
+
+		signature = [self.COMPILED_VERSION] + [[p, os.stat(p).st_size, os.stat(p).st_mtime_ns] for p in [suburbs_path, teg_venues_path]]
+
+		try:
+			compiled = pickle.load(open(compiled_path, 'rb'))
+		except (OSError, EOFError, pickle.UnpicklingError):
+			compiled = None
+
+		if (not compiled) or (compiled.get('signature') != signature):
+
+			compiled = self.compile(json.load(open(suburbs_path, 'r')), json.load(open(teg_venues_path, 'r')))
+			compiled['signature'] = signature
+
+			_atomic_write(compiled_path, pickle.dumps(compiled, protocol=pickle.HIGHEST_PROTOCOL))
+
+		self._use(compiled)
+
+	@classmethod
+	def from_data(cls, aus_suburbs, teg_venues):
+
+		'''
+		TEGCodeFinder for reference data already in memory, e.g. synthetic data
+		'''
+
+		tcf = cls.__new__(cls)
+
+		return tcf._use(tcf.compile(aus_suburbs, teg_venues))
+
+	def compile(self, aus_suburbs, teg_venues):
+
+		return {'STATES_AND_REGIONS': {s['state'] for l in aus_suburbs for s in aus_suburbs[l]} | {v['state'] for v in teg_venues},
+					'TEG_INDEX': self._index_teg_venues(teg_venues), 
+						'SUBURB_TRIE': self._build_suburb_trie(aus_suburbs)}
+
+	def _use(self, compiled):
+
+		self.STATES_AND_REGIONS = compiled['STATES_AND_REGIONS']
+		self.TEG_INDEX = compiled['TEG_INDEX']
+		self.SUBURB_TRIE = compiled['SUBURB_TRIE']
+
+		return self
+
+	def _build_suburb_trie(self, aus_suburbs):
+
+		'''
+		token trie over all NORMALISED suburb names: {token: {token: {.., None: [(suburb, state),..]}}}; 
+		None marks the end of a suburb name
+		'''
+
+		trie = {}
+
+		for l in aus_suburbs:
+			for s in aus_suburbs[l]:
+
+				words = tn.normalise(s['name']).split()
+
+				if not words:
+					continue
+
+				node = trie
+
+				for w in words:
+					node = node.setdefault(w, {})
+
+				node.setdefault(None, []).append((s['name'], s['state']))
+
+		return trie
+
+	def _index_teg_venues(self, teg_venues):
+
+		'''
+		normalise TEG venue names once and partition them by state; within each state there's an 
+		inverted index {token: {venue positions}} so that a lookup only touches venues sharing tokens with it
+		'''
+
+		teg_index = defaultdict(lambda: {'names': [], 'teg_codes': [], 'tokens': defaultdict(set)})
+
+		for teg_venue in teg_venues:
+
+			if not teg_venue['name'].strip():
+				continue
+
+			part = teg_index[teg_venue['state'].lower()]
+
+			name_norm = tn.normalise(teg_venue['name'])
+
+			for w in name_norm.split():
+				part['tokens'][w].add(len(part['names']))
+
+			part['names'].append(name_norm)
+			part['teg_codes'].append(teg_venue['teg_code'])
+
+		return dict(teg_index)
+
+	def _find_suburbs(self, st_norm):
+
+		'''
+		returns all (suburb, state) found in NORMALISED string st_norm in one pass, in order of appearance
+		'''
+
+		words = st_norm.split()
+		suburbs = []
+
+		for i in range(len(words)):
+
+			node = self.SUBURB_TRIE
+
+			for w in words[i:]:
+				
+				node = node.get(w)
+
+				if node is None:
+					break
+
+				suburbs.extend(node.get(None, []))
+
+		return suburbs
+
 	def _find_state_by_suburb(self, st_norm):
 		'''
 		find suburb and then the corresp. state in NORMALISED string st
 		'''   
-		suburb_candidates = set()
-		
-		for w in st_norm.split():
-			if w[0] in self.AUS_SUBURBS:
-				for s in self.AUS_SUBURBS[w[0]]:         
-					_ = re.search(r'\b' + s['name'] + r'\b', st_norm)
-					if _:
-						suburb_candidates.add((s['name'], s['state']))
-				if len(suburb_candidates) == 1:
-					return list(suburb_candidates).pop()[1]
-				elif len(suburb_candidates) > 1:
-					# pick the state corresp. to the longest suburb name
-					return max(suburb_candidates, key=lambda _: len(_[0].split()))[1]
-				else:    # no suburbs found in location
-					return None
+		with metrics.timer('teg', op='suburb_match'):
+			suburb_candidates = self._find_suburbs(st_norm)
+
+		if not suburb_candidates:    # no suburbs found in location
+			return None
+
+		# pick the state corresp. to the longest suburb name
+		return max(suburb_candidates, key=lambda _: len(_[0].split()))[1]
+
+	def find_states_by_suburb(self, strings_norm):
+
+		'''
+		batch version of _find_state_by_suburb; returns a state or None for each NORMALISED string 
+		'''
+
+		return [self._find_state_by_suburb(st_norm) for st_norm in strings_norm]
 		
 	def _get_venue_state(self, venue_record):
 		
@@ -72,8 +558,7 @@ class TEGCodeFinder:
 				return state_loc_sub
 		
 		if 'known_as' in venue_record:
-			for name in venue_record['known_as']:
-				state_known_as = self._find_state_by_suburb(tn.normalise(name))
+			for state_known_as in self.find_states_by_suburb(tn.normalise(name) for name in venue_record['known_as']):
 				if state_known_as:
 					return state_known_as         
 		
@@ -84,127 +569,1811 @@ class TEGCodeFinder:
 		'''
 		found_tegcodes = []  # teg codes for this venue
 
-		venue_state = self._get_venue_state(venue_record)
+		with metrics.timer('teg', op='venue_state'):
+			venue_state = self._get_venue_state(venue_record)
 		
 		if venue_state:
-	
-			for teg_venue in self.TEG_VENUES:
-			
-				if teg_venue['name'].strip():
-					if re.search(r'\b' + tn.normalise(venue_record['name'])  + r'\b', tn.normalise(teg_venue['name'])) and (venue_state.lower() == teg_venue['state'].lower()):
-						found_tegcodes.append(teg_venue['teg_code'])
-			
-			if ('known_as' in venue_record):
-				for teg_venue in self.TEG_VENUES:
-					for former_name in venue_record['known_as']:
-						if teg_venue['name'].strip():
-							if re.search(r'\b' + tn.normalise(former_name) + r'\b', tn.normalise(teg_venue['name'])) and (venue_state.lower() == teg_venue['state'].lower()):
-								found_tegcodes.append(teg_venue['teg_code'])
 
-		return {'state': venue_state, 'teg_code': list(set(found_tegcodes))}
+			with metrics.timer('teg', op='venue_match'):
+				for name in [venue_record['name']] + venue_record.get('known_as', []):
+					found_tegcodes.extend(self._match_teg_venues(tn.normalise(name), venue_state))
 
+		return {'state': venue_state, 'teg_code': list(set(found_tegcodes))}
 
-class BaseSportDBCreator(metaclass=ABCMeta):
+	def _match_teg_venues(self, name_norm, state):
 
-	@abstractmethod
-	def _is_sport_supported(self):
 		'''
-		check that we can create database for this sport
+		returns TEG codes of the venues in state whose normalised names contain NORMALISED name_norm
 		'''
-		pass
 
-class SportDBCreator(BaseSportDBCreator):
+		part = self.TEG_INDEX.get(state.lower())
+		tokens = name_norm.split()
 
-	def _is_sport_supported(self):
+		# an empty name can't identify any venue
+		if not (part and tokens):
+			return []
 
-		if self.sport not in self.team_urls:
-			return False
-		else:
-			return True
+		# a venue can only match if it has every token of the name; start from the rarest one
+		postings = sorted((part['tokens'].get(w, set()) for w in set(tokens)), key=len)
+		candidates = postings[0].intersection(*postings[1:])
 
-	def _setup_processors(self):
+		if not candidates:
+			return []
 
-		self.processors = {'team': 
-							{"full name": lambda _: _.split("[")[0],
-							"nickname(s)":  lambda _: [nick.split("[")[0].strip() for nick in _.split(",")],  # nicknames are comma separated
-							"founded": lambda _: str(arrow.get(_.split(";")[0], "YYYY").year),
-							"ground": lambda _: [g.split('(')[0].strip() for g in _.split('\n')],   	# if multiple, they come in separate lines
-							"ground capacity": lambda _: ''.join([c for c in _ if c.isdigit() or c.isspace()]).split(),
-							'history': lambda _: [w.strip() for w in _.split('\n') if len([p for p in w if p.isdigit()]) < 4],
-							'arena': lambda _: [w.strip() for w in _.split('\n') if len([p for p in w if p.isdigit()]) < 4],
-							'arena capacity': lambda _: [w for w in _.replace(',','').split() if w.isdigit()],
-							'location': lambda _: _.replace("\n", ' '),
-							'team colors': lambda _: [w.strip() for w in _.split(',')]}, 
-							'sponsor': lambda _: _.split('[')[0].split('(')[0].strip(),	
-							"venue": {"former names": lambda _: [g.split('(')[0].strip() for g in _.split('\n')],
-										"owner": lambda _: [g.split('(')[0].strip() for g in _.split('\n')],
-										"operator": lambda _: [g.split('(')[0].strip() for g in _.split('\n')],
-										# "capacity": lambda _: _.split("[")[0],
-										"field size": lambda _: 'x'.join([c for c in _.split() if c.isdigit()]),
-										"opened": lambda _: str(arrow.get(_.split(";")[0], "YYYY").year),
-										"location": lambda _: ','.join([w.strip() for w in _.split('\n')]),
-										"surface": lambda _: _,
-										"expanded": lambda _: _,
-										"renovated": lambda _: _,}}
+		rx = re.compile(r'\b' + name_norm + r'\b')
 
+		return [part['teg_codes'][i] for i in sorted(candidates) if rx.search(part['names'][i])]
 
-		return self
+	def find_teg_codes(self, venue_records):
 
+		'''
+		batch version of find_teg_code; returns a list of {state, teg_code} in the order of venue_records
+		'''
 
-	def __init__(self):
+		return [self.find_teg_code(venue_record) for venue_record in venue_records]
 
-		print('initializing class...', end='')
 
-		# do we have DATA directory? if we do, what about the team url files? if no directory exists, throw error
-		if not os.path.isdir('data'):
-			raise Exception('data directory is absent!')
+class TokenBucket:
 
-		# try to read the team wiki urls file
-		try:
-			self.team_urls = json.load(open('data/team-wiki-urls.json','r'))
-		except:
-			raise Exception('you need to have a file with team wikipedia urls in data directory!')
+	'''
+	allows rate requests per second on average with bursts of up to burst requests
+	'''
 
-		self.sport = sys.argv[1]
+	def __init__(self, rate, burst=1):
 
-		if not self._is_sport_supported():
-			raise Exception(f'sport {self.sport} is not currently supported, come back later..')
+		self.rate = rate
+		self.burst = max(1, burst)
+		self.tokens = self.burst
+		self.last = time.monotonic()
+		self.lock = threading.Lock()
 
-		self._setup_processors()
+	def acquire(self):
 
-		self.socials_of_interest = 'facebook instagram youtube twitter'.split()
+		while True:
 
-		# prepopulate containers for collected data
-		self.team_data = [{"name": team, "sport": self.sport, "wiki_url": self.team_urls[self.sport][team]} for team in self.team_urls[self.sport]]
-		self.venue_data = []
+			with self.lock:
 
-		print('ok')
+				now = time.monotonic()
+				self.tokens = min(self.burst, self.tokens + (now - self.last)*self.rate)
+				self.last = now
 
-		self.GROUND_SYNS = {'ground', 'complex', 'oval', 'hub', 'park', 'showgrounds', 'stadium', 
-								'field', 'reserve', 'estadio', 'club', 'sport', 'arena', 'sports', 'the', 'centre', 'center'}
-		self.LEAGUE_NMS = {'npl': 'national premier leagues', 'afl': 'australian football league',
-								'nbl': 'national basketball league'}
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
 
-		self.RE_YEAR = re.compile(r'\d{4}')
-		self.RE_COLOR = re.compile('(?<=\")[a-zA-Z ]+(?=\")')
+				wait = (1 - self.tokens)/self.rate
 
-	def _scrape_team_infobox(self, team_soup):
+			time.sleep(wait)
 
+
+class HTTPFetcher:
+
+	'''
+	pooled keep-alive http session with timeouts, retries with exponential backoff and 
+	a per-host rate limit; safe to share between threads
+	'''
+
+	RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+	def __init__(self, rate=5, burst=5, timeout=(5, 30), retries=4, pool_size=16,
+					user_agent='austeams-db (https://github.com/eeghor/austeams-db)'):
+
+		self.rate = rate
+		self.burst = burst
+		self.timeout = timeout
+		self.retries = retries
+		self.backoff = 0.5
+
+		from requests.adapters import HTTPAdapter
+
+		self.session = requests.Session()
+		self.session.headers['User-Agent'] = user_agent
+
+		# retries are done in fetch() rather than by urllib3 so that every attempt waits for the rate limit
+		adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+		
+		self.session.mount('https://', adapter)
+		self.session.mount('http://', adapter)
+
+		self._buckets = {}   # {host: TokenBucket,..}
+		self._lock = threading.Lock()
+
+	def _bucket(self, host):
+
+		with self._lock:
+			if host not in self._buckets:
+				self._buckets[host] = TokenBucket(self.rate, self.burst)
+			return self._buckets[host]
+
+	def _retry_wait(self, attempt, r=None):
+
+		'''
+		seconds to wait before retry attempt (1, 2,..): what the server asked for in Retry-After if anything, 
+		exponential backoff otherwise
+		'''
+
+		after = r.headers.get('Retry-After') if r is not None else None
+
+		if after:
+			try:
+				return max(0, float(after))
+			except ValueError:
+				pass
+			try:
+				return max(0, parsedate_to_datetime(after).timestamp() - time.time())
+			except (TypeError, ValueError):
+				pass
+
+		return self.backoff*2**(attempt - 1)
+
+	def fetch(self, url, headers=None, stream=False, timeout=None):
+
+		'''
+		with stream=True only the headers are read; the body is then read with iter_content() and 
+		the response should be closed. connection errors, timeouts and responses with RETRY_STATUSES are 
+		retried up to retries times, each attempt taking its turn in the host's rate limit; once retries 
+		run out the last response is returned or the last error raised
+		'''
+
+		bucket = self._bucket(urlparse(url).netloc)
+
+		for attempt in range(self.retries + 1):
+
+			if attempt:
+				time.sleep(wait)
+
+			bucket.acquire()
+
+			try:
+				r = self.session.get(url, headers=headers, stream=stream, timeout=timeout or self.timeout)
+			except (requests.ConnectionError, requests.Timeout):
+				if attempt == self.retries:
+					raise
+				wait = self._retry_wait(attempt + 1)
+				continue
+
+			if (r.status_code not in self.RETRY_STATUSES) or (attempt == self.retries):
+				return r
+
+			wait = self._retry_wait(attempt + 1, r)
+			r.close()
+
+
+class StageGraph:
+
+	'''
+	stages running on threads and connected by bounded queues; a stage blocks when its output queue is full, 
+	so a slow stage holds back the ones feeding it. if a stage fails, all stages stop and run() raises the error
+	'''
+
+	_DONE = object()
+
+	def __init__(self, queue_size=16):
+
+		self.queue_size = queue_size
+
+		self._stages = []    # [(stage name, fn, input queue name, output queue names, worker threads, batch size),..]
+		self._queues = {}    # {queue name: queue.Queue,..}
+
+		# worker threads writing to and reading from each queue, and writers that have finished
+		self._producers = defaultdict(int)
+		self._consumers = defaultdict(int)
+		self._closed = defaultdict(int)
+
+		self._lock = threading.Lock()
+		self._failed = threading.Event()
+		self._errors = []
+
+	def add(self, name, fn, inbox, outboxes=(), workers=1, batch=None):
+
+		'''
+		fn(item, emit) is called for every item in queue inbox and passes items on with emit(queue name, item), 
+		where the queue is one of outboxes. with batch, fn gets a list of the items waiting in inbox instead, 
+		at most batch of them
+		'''
+
+		self._stages.append((name, fn, inbox, tuple(outboxes), workers, batch))
+
+		self._consumers[inbox] += workers
+
+		for q in outboxes:
+			self._producers[q] += workers
+			
+		return self
+
+	def _queue(self, name):
+
+		with self._lock:
+			if name not in self._queues:
+				self._queues[name] = queue.Queue(maxsize=self.queue_size)
+			return self._queues[name]
+
+	def _put(self, name, item):
+
+		q = self._queue(name)
+		t0 = time.perf_counter()
+
+		# don't wait forever on a queue whose readers have stopped
+		while not self._failed.is_set():
+			try:
+				q.put(item, timeout=0.1)
+				break
+			except queue.Full:
+				continue
+
+		metrics.observe('queue_wait', time.perf_counter() - t0, queue=name, op='put')
+
+	def _get(self, name):
+
+		q = self._queue(name)
+		t0 = time.perf_counter()
+
+		while not self._failed.is_set():
+			try:
+				item = q.get(timeout=0.1)
+				metrics.observe('queue_wait', time.perf_counter() - t0, queue=name, op='get')
+				return item
+			except queue.Empty:
+				continue
+
+		return self._DONE
+
+	def _close(self, name):
+
+		# once the last writer is done, tell every reader
+		with self._lock:
+			self._closed[name] += 1
+			last = (self._closed[name] == self._producers[name])
+
+		if last:
+			for _ in range(self._consumers[name]):
+				self._put(name, self._DONE)
+
+	def _work(self, fn, inbox, outboxes, batch):
+
+		def emit(name, item):
+			if name not in outboxes:
+				raise Exception(f'stage can\'t write to queue {name}!')
+			self._put(name, item)
+
+		try:
+			done = False
+			while not done:
+
+				item = self._get(inbox)
+
+				if item is self._DONE:
+					break
+
+				if not batch:
+					fn(item, emit)
+					continue
+
+				# take whatever else is already waiting
+				items = [item]
+
+				while len(items) < batch:
+					try:
+						item = self._queue(inbox).get_nowait()
+					except queue.Empty:
+						break
+					if item is self._DONE:
+						done = True
+						break
+					items.append(item)
+
+				fn(items, emit)
+		except BaseException as e:
+			self._errors.append(e)
+			self._failed.set()
+		finally:
+			for name in outboxes:
+				self._close(name)
+
+	def run(self, source, items):
+
+		'''
+		feeds items into queue source and waits until all stages are done
+		'''
+
+		self._producers[source] += 1
+
+		for name in self._producers:
+			if not self._consumers[name]:
+				raise Exception(f'nothing reads from queue {name}!')
+
+		threads = [threading.Thread(target=self._work, args=(fn, inbox, outboxes, batch), name=f'{name}-{i}', daemon=True) 
+						for name, fn, inbox, outboxes, workers, batch in self._stages for i in range(workers)]
+
+		for t in threads:
+			t.start()
+
+		try:
+			for item in items:
+				self._put(source, item)
+		finally:
+			self._close(source)
+
+		for t in threads:
+			t.join()
+
+		if self._errors:
+			raise self._errors[0]
+
+		return self
+
+
+class DumpResponse:
+
+	'''
+	the bits of requests.Response that PageCache uses, for pages read from a dump or put together from API responses
+	'''
+
+	def __init__(self, status_code, content=b''):
+
+		self.status_code = status_code
+		self.content = content
+		self.headers = {}
+		self.encoding = 'utf-8'
+
+	def json(self):
+
+		return json.loads(self.content)
+
+
+class DumpSource:
+
+	'''
+	reads wikipedia pages from a local HTML dump instead of the web. the dump is a bz2 multistream file, 
+	each stream holding ndjson records like in Wikimedia Enterprise HTML dumps: {"name": title, 
+	"article_body": {"html": ..}, "redirects": [{"name": ..},..]}. a title -> stream offset index is built 
+	on first use and saved next to the dump, so a page is read by seeking to its stream and decompressing 
+	only that one
+	'''
+
+	remote = False   # nothing to cache on disk or rate limit
+
+	def __init__(self, dump_path, index_path=None, max_streams=8):
+
+		self.dump_path = dump_path
+		self.index_path = index_path if index_path else dump_path + '.index.json'
+		self.max_streams = max_streams
+
+		self._streams = OrderedDict()    # {offset: {title: html},..} for recently read streams
+		self._lock = threading.Lock()
+
+		self.index = self._load_index()
+
+	def _dump_id(self):
+
+		st = os.stat(self.dump_path)
+
+		return [st.st_size, st.st_mtime]
+
+	def _iter_streams(self):
+
+		'''
+		yields (offset, decompressed content) for every bz2 stream in the dump
+		'''
+
+		with open(self.dump_path, 'rb') as f:
+
+			offset = 0
+			data = b''
+
+			while True:
+
+				dec = bz2.BZ2Decompressor()
+				start = offset
+				out = []
+
+				while not dec.eof:
+
+					if not data:
+						data = f.read(1 << 20)
+						if not data:
+							if out:
+								raise Exception(f'dump {self.dump_path} is truncated!')
+							return
+
+					out.append(dec.decompress(data))
+
+					if dec.eof:
+						offset += len(data) - len(dec.unused_data)
+						data = dec.unused_data
+					else:
+						offset += len(data)
+						data = b''
+
+				yield start, b''.join(out)
+
+	def _read_stream(self, offset):
+
+		with open(self.dump_path, 'rb') as f:
+
+			f.seek(offset)
+			dec = bz2.BZ2Decompressor()
+			out = []
+
+			while not dec.eof:
+				data = f.read(1 << 16)
+				if not data:
+					break
+				out.append(dec.decompress(data))
+
+		return b''.join(out)
+
+	def _load_index(self):
+
+		try:
+			saved = json.load(open(self.index_path, 'r'))
+			if saved['dump'] == self._dump_id():
+				return saved['titles']
+		except (OSError, ValueError, KeyError):
+			pass
+
+		titles = {}   # {title or redirect: [stream offset, title],..}
+
+		for offset, content in self._iter_streams():
+			for line in content.splitlines():
+				if line.strip():
+					page = json.loads(line)
+					titles[page['name']] = [offset, page['name']]
+					for r in page.get('redirects', []):
+						titles.setdefault(r['name'], [offset, page['name']])
+
+		json.dump({'dump': self._dump_id(), 'titles': titles}, open(self.index_path, 'w'))
+
+		return titles
+
+	def get_page(self, title):
+
+		'''
+		returns html of the page with title (or redirecting from it) or None
+		'''
+
+		if title not in self.index:
+			# titles are case sensitive except for the first letter
+			title = title[:1].upper() + title[1:]
+			if title not in self.index:
+				return None
+
+		offset, name = self.index[title]
+
+		with self._lock:
+
+			if offset not in self._streams:
+				self._streams[offset] = {p['name']: p['article_body']['html'] for p in 
+											(json.loads(line) for line in self._read_stream(offset).splitlines() if line.strip())}
+				if len(self._streams) > self.max_streams:
+					self._streams.popitem(last=False)
+
+			self._streams.move_to_end(offset)
+
+			return self._streams[offset].get(name)
+
+	def resolve(self, title):
+
+		'''
+		returns the title of the page title redirects to (or title itself), None if there's no such page
+		'''
+
+		if title not in self.index:
+			title = title[:1].upper() + title[1:]
+
+		return self.index[title][1] if title in self.index else None
+
+	def fetch(self, url, headers=None):
+
+		html = self.get_page(wiki_title(url)) if '/wiki/' in urlparse(url).path else None
+
+		return DumpResponse(200, html.encode()) if html is not None else DumpResponse(404)
+
+	@staticmethod
+	def write(dump_path, pages, pages_per_stream=100):
+
+		'''
+		write pages, an iterable of dump records (dicts), into a dump that DumpSource can read
+		'''
+
+		with open(dump_path, 'wb') as f:
+
+			stream = []
+
+			for page in chain(pages, [None]):
+
+				if page is not None:
+					stream.append(json.dumps(page))
+
+				if stream and ((page is None) or (len(stream) == pages_per_stream)):
+					f.write(bz2.compress(('\n'.join(stream) + '\n').encode()))
+					stream = []
+
+
+class APISource:
+
+	'''
+	gets wikipedia pages through the MediaWiki Action API rather than as rendered web pages: a page is the 
+	action=parse output for its title (no skin, so much less to download) in a bare document that still has 
+	the revision id where a scraped page has it. titles, redirects, revision ids and the like are asked for 
+	many pages at a time, see PageCache.page_info. anything else, API queries and logos included, is fetched as is
+	'''
+
+	PAGE = ('<!DOCTYPE html><html><head><title>{title}</title><script>RLCONF={rlconf};</script></head>'
+				'<body><div id="mw-content-text">{text}</div></body></html>')
+
+	def __init__(self, api_url='https://en.wikipedia.org/w/api.php', fetcher=None):
+
+		self.api_url = api_url
+		self.fetcher = fetcher if fetcher else HTTPFetcher()
+
+	def fetch(self, url, headers=None, **kwargs):
+
+		u = urlparse(url)
+
+		if not (u.netloc.endswith('wikipedia.org') and u.path.startswith('/wiki/')):
+			return self.fetcher.fetch(url, headers=headers, **kwargs)
+
+		r = self.fetcher.fetch(self.api_url + '?' + urlencode({'action': 'parse', 'page': wiki_title(url), 'prop': 'text|revid', 
+									'redirects': 1, 'disableeditsection': 1, 'disablelimitreport': 1, 'format': 'json', 'formatversion': 2}))
+
+		if r.status_code != 200:
+			return r
+
+		try:
+			parsed = r.json()
+		except ValueError as e:
+			# e.g. an error page from a proxy; fail like any other bad response
+			raise requests.RequestException(f'not a json response from {self.api_url}: {e}', response=r) from e
+
+		if 'parse' not in parsed:
+			# missingtitle and the like
+			return DumpResponse(404)
+
+		p = parsed['parse']
+		rlconf = json.dumps({'wgPageName': p['title'].replace(' ', '_'), 'wgArticleId': p.get('pageid'), 'wgRevisionId': p.get('revid')}, 
+								separators=(',', ':'))
+
+		return DumpResponse(200, self.PAGE.format(title=p['title'], rlconf=rlconf, text=p['text']).encode())
+
+
+def wiki_title(url):
+
+	'''
+	wikipedia page title from its url, e.g. https://en.wikipedia.org/wiki/Sydney_FC#History -> Sydney FC
+	'''
+
+	return unquote(urlparse(url).path.split('/wiki/', 1)[-1]).replace('_', ' ')
+
+def wiki_url(title, host='en.wikipedia.org'):
+
+	'''
+	wikipedia page url from its title, written the way wikipedia links to it, e.g. Kardinia Park (stadium) -> 
+	https://en.wikipedia.org/wiki/Kardinia_Park_(stadium)
+	'''
+
+	return 'https://' + host + '/wiki/' + quote(title.replace(' ', '_'), safe="/:(),!*;@$~")
+
+def canonical_wiki_url(url):
+
+	'''
+	one url for all the ways of linking to a wikipedia page, apart from redirects: no #fragment or query, 
+	no mobile host and the title normalised like mediawiki does (single spaces, first letter in upper case). 
+	red links (/w/index.php?title=..&redlink=1) become the url the page would have; urls that aren't links 
+	to a page are returned as they are
+	'''
+
+	u = urlparse(url)
+
+	if u.path.startswith('/wiki/'):
+		title = wiki_title(url)
+	elif (u.path == '/w/index.php') and parse_qs(u.query).get('title'):
+		title = parse_qs(u.query)['title'][0].replace('_', ' ')
+	else:
+		return url
+
+	title = ' '.join(title.split())
+
+	return wiki_url(title[:1].upper() + title[1:], urlparse(url).netloc.lower().replace('.m.wikipedia.org', '.wikipedia.org'))
+
+def venue_id(url):
+
+	'''
+	short stable id of the venue with canonical wikipedia url, the same in every build and shard
+	'''
+
+	return hashlib.sha1(url.encode()).hexdigest()[:12]
+
+class HeadingClassifier:
+
+	'''
+	maps infobox row headings to record keys; rules are tried in order and the first one matching wins. a rule 
+	is {'key': .., 'any': [..]} plus optionally 'all': [..], 'none': [..] (substrings the heading must all have 
+	or can't have) and 'max_words'. headings repeat a lot across pages so the answers are remembered
+	'''
+
+	def __init__(self, rules, max_seen=10000):
+
+		self.rules = [(r['key'], re.compile('|'.join(map(re.escape, r['any']))), tuple(r.get('all', [])), 
+						tuple(r.get('none', [])), r.get('max_words')) for r in rules]
+
+		self.max_seen = max_seen
+		self._seen = {}    # {heading: key or None,..}
+		self._lock = threading.Lock()
+
+	def _classify(self, heading):
+
+		for key, any_rx, all_of, none_of, max_words in self.rules:
+			if (any_rx.search(heading) and all(w in heading for w in all_of) and not any(w in heading for w in none_of) 
+					and ((max_words is None) or (len(heading.split()) <= max_words))):
+				return key
+
+	def classify(self, heading):
+
+		# pipeline threads share the classifiers, so the memo is only looked at and changed under the lock
+		with self._lock:
+			if heading in self._seen:
+				return self._seen[heading]
+
+		key = self._classify(heading)
+
+		with self._lock:
+
+			if len(self._seen) >= self.max_seen:
+				self._seen.clear()
+
+			self._seen[heading] = key
+
+		return key
+
+TEAM_HEADINGS = HeadingClassifier([{'key': 'union', 'any': ['union']},
+									{'key': 'nickname', 'any': ['nick']},
+									{'key': 'location', 'any': ['locat']},
+									{'key': 'ground', 'any': ['ground', 'arena'], 'none': ['capacity']},
+									{'key': 'league', 'any': ['league', 'competition'], 'max_words': 2},
+									{'key': 'website', 'any': ['website']},
+									{'key': 'known_as', 'any': ['history']},
+									{'key': 'colours', 'any': ['colo']}])
+
+VENUE_HEADINGS = HeadingClassifier([{'key': 'established', 'any': ['establ', 'opened', 'founded']},
+									{'key': 'capacity', 'any': ['capacity']},
+									{'key': 'location', 'any': ['locat']},
+									{'key': 'coordinates', 'any': ['coord']},
+									{'key': 'owner', 'any': ['own']},
+									{'key': 'known_as', 'any': ['former'], 'all': ['name']}])
+
+# page regions the scrapers actually read
+PAGE_REGIONS = ('infobox', 'sponsors', 'squad', 'colours')
+
+# headings sponsors can be under, best first
+SPONSOR_HEADINGS = ('Sponsorship', 'Sponsors', 'Colours and badge')
+
+def _section(heading_span, stop_at):
+
+	# the heading a span is in and its first following sibling among stop_at
+	heading = heading_span.getparent()
+
+	return [heading] + heading.xpath('following-sibling::*[' + ' or '.join(f'self::{t}' for t in stop_at) + '][1]')
+
+def page_regions(tree):
+
+	'''
+	finds all PAGE_REGIONS of a page (an lxml tree) in one walk over its tables, spans, cells and links; 
+	returns {region: elements that have to be kept, in document order}
+	'''
+
+	infobox = toccolours = image = squad = None
+	sponsor_spans = {}    # {position in SPONSOR_HEADINGS: first span,..}
+
+	for e in tree.iter('table', 'span', 'td', 'a'):
+
+		classes = (e.get('class') or '').split()
+
+		if e.tag == 'span':
+
+			span_id = e.get('id')
+
+			if (span_id in ('Sponsorship', 'Sponsors')) and (span_id in e.text_content()):
+				sponsor_spans.setdefault(SPONSOR_HEADINGS.index(span_id), e)
+			elif (span_id == 'First_team_squad') and (squad is None):
+				squad = e
+
+			if ('mw-headline' in classes) and (e.text_content() == 'Colours and badge'):
+				sponsor_spans.setdefault(2, e)
+
+		elif (e.tag == 'table') and (infobox is None) and ('infobox' in classes):
+			infobox = e
+		elif (e.tag == 'td') and (toccolours is None) and ('toccolours' in classes):
+			toccolours = e
+		elif (e.tag == 'a') and (image is None) and ('image' in classes):
+			image = e
+
+		# nothing further down the page can change the regions
+		if (0 in sponsor_spans) and all(x is not None for x in (infobox, toccolours, image, squad)):
+			break
+
+	return {'infobox': [infobox] + infobox.xpath('following-sibling::p[1]') if infobox is not None else [],
+			'sponsors': _section(sponsor_spans[min(sponsor_spans)], stop_at=['table', 'h2']) if sponsor_spans else [],
+			'squad': _section(squad, stop_at=['table']) if squad is not None else [],
+			'colours': [e for e in (toccolours, image) if e is not None]}
+
+def logo_url(regions):
+
+	'''
+	url of the team logo in the colours region of page_regions, the first image link there; None if there's none
+	'''
+
+	for e in regions['colours']:
+		for a in e.iter('a'):
+			if 'image' in (a.get('class') or '').split():
+				img = next(a.iter('img'), None)
+				return 'https:' + img.get('src') if (img is not None) and img.get('src') else None
+
+	return None
+
+def _elements_html(elements):
+
+	# table cells are wrapped in a table so that they survive re-parsing
+	parts = []
+
+	for e in elements:
+		e_html = lxml_html.tostring(e, encoding='unicode', with_tail=False)
+		parts.append(f'<table><tr>{e_html}</tr></table>' if e.tag in ('td', 'th') else e_html)
+
+	return '\n'.join(parts)
+
+def region_html(tree, region, regions=None):
+
+	'''
+	cut the elements of a region out of a page (html or an lxml tree); region can also be a tuple of regions, 
+	then each one is put in its own <div data-region=".."> so that walking siblings never leaves a region. 
+	regions are the page_regions of tree if already known
+	'''
+
+	if isinstance(tree, str):
+		tree = lxml_html.document_fromstring(tree)
+
+	regions = regions or page_regions(tree)
+
+	if isinstance(region, str):
+		return _elements_html(regions[region])
+
+	return '\n'.join(f'<div data-region="{r}">{_elements_html(regions[r])}</div>' for r in region)
+
+class LinkBlockTarget:
+
+	'''
+	lxml parser target collecting the links in the first <div> with class block_class; done is set 
+	once that div is closed, so that whoever feeds the parser can stop reading the page there
+	'''
+
+	def __init__(self, block_class):
+
+		self.block_class = block_class
+		self.links = []
+		self.done = False
+
+		self._depth = 0    # divs open inside the block, the block itself included
+
+	def start(self, tag, attrib):
+
+		if self.done:
+			return
+
+		if tag == 'div':
+			if self._depth:
+				self._depth += 1
+			elif self.block_class in attrib.get('class', '').split():
+				self._depth = 1
+		elif (tag == 'a') and self._depth and attrib.get('href'):
+			self.links.append(attrib['href'])
+
+	def end(self, tag):
+
+		if (tag == 'div') and self._depth:
+			self._depth -= 1
+			self.done = not self._depth
+
+	def data(self, data):
+		pass
+
+	def close(self):
+
+		return self.links
+
+# the SportDBCreator a parse pool worker scrapes with, see _init_extractor
+_extractor = None
+
+def _init_extractor(extractor):
+
+	'''
+	parse pool initializer; with fork, extractor (and its scraper configuration) reaches the worker without pickling
+	'''
+
+	global _extractor
+	_extractor = extractor
+
+def plain(rec):
+
+	'''
+	a scraped record as plain dicts and lists (no defaultdicts or Counters), the same whichever way it was scraped
+	'''
+
+	return json.loads(json.dumps(rec))
+
+def _extract(job):
+
+	'''
+	runs in a parse pool worker: parses html (or just a region of it) and returns the scraped record as plain dicts 
+	along with (wall, cpu) times of parsing and of the whole extraction
+	'''
+
+	scraper, html, region = job
+
+	wall, cpu = time.perf_counter(), time.thread_time()
+
+	soup = bs4.BeautifulSoup(region_html(html, region), 'lxml') if region else bs4.BeautifulSoup(html, 'html.parser')
+
+	parsed = (time.perf_counter() - wall, time.thread_time() - cpu)
+
+	rec = plain(getattr(_extractor, scraper)(soup))
+
+	# the worker's metrics are lost with it, so timings go back with the record
+	return (rec, parsed, (time.perf_counter() - wall, time.thread_time() - cpu))
+
+
+class PageCache:
+
+	'''
+	fetches each page once: raw responses go to an on-disk cache keyed by url hash (revalidated 
+	with ETag/Last-Modified once older than ttl seconds) and parsed documents are kept in an 
+	in-process LRU cache
+	'''
+
+	def __init__(self, cache_dir='data_cache/pages', ttl=24*3600, max_docs=128, fetcher=None, max_workers=8):
+
+		self.cache_dir = cache_dir
+		self.ttl = ttl
+		self.max_docs = max_docs
+		self.fetcher = fetcher if fetcher else HTTPFetcher()
+		self.max_workers = max_workers
+
+		# metadata queries go wherever the pages come from
+		self.api_url = getattr(self.fetcher, 'api_url', 'https://en.wikipedia.org/w/api.php')
+
+		self._docs = OrderedDict()   # {(url, parser): soup,..}, most recently used last
+		self._docs_lock = threading.RLock()
+
+		self._canonical = {}    # {normalised url: url after redirects,..}
+		self.info = {}          # {canonical url: what page_info last found out about the page,..}
+
+		if not os.path.isdir(self.cache_dir):
+			os.makedirs(self.cache_dir)
+
+	def _paths(self, url):
+
+		k = hashlib.sha1(url.encode()).hexdigest()
+
+		return (os.path.join(self.cache_dir, k + '.body'), os.path.join(self.cache_dir, k + '.json'))
+
+	def _write(self, path, content):
+
+		# concurrent runs never see half-written entries
+		_atomic_write(path, content)
+
+	def _read_meta(self, url):
+
+		body_path, meta_path = self._paths(url)
+
+		if not (os.path.isfile(body_path) and os.path.isfile(meta_path)):
+			return None
+
+		try:
+			return json.load(open(meta_path, 'r'))
+		except ValueError:
+			return None
+
+	def _fetch(self, url, headers=None):
+
+		t0 = time.perf_counter()
+
+		try:
+			r = self.fetcher.fetch(url, headers=headers)
+		except Exception:
+			metrics.request(url, 'error', 0, time.perf_counter() - t0)
+			raise
+
+		metrics.request(url, r.status_code, len(r.content or b''), time.perf_counter() - t0)
+
+		return r
+
+	def get_content(self, url):
+
+		'''
+		returns response body for url as bytes, from the disk cache if possible
+		'''
+
+		# local sources are as fast as the disk cache
+		if not getattr(self.fetcher, 'remote', True):
+			return self._fetch(url).content
+
+		body_path, meta_path = self._paths(url)
+		meta = self._read_meta(url)
+
+		headers = {}
+
+		if meta:
+
+			if (self.ttl is None) or (time.time() - meta['fetched_at'] < self.ttl):
+				metrics.count('page_cache', result='hit')
+				return open(body_path, 'rb').read()
+
+			# stale entry; ask the server whether it has changed
+			if meta.get('etag'):
+				headers['If-None-Match'] = meta['etag']
+			if meta.get('last_modified'):
+				headers['If-Modified-Since'] = meta['last_modified']
+
+		r = self._fetch(url, headers)
+
+		if (r.status_code == 304) and meta:
+			metrics.count('page_cache', result='not_modified')
+			meta['fetched_at'] = time.time()
+			self._write(meta_path, json.dumps(meta).encode())
+			return open(body_path, 'rb').read()
+
+		metrics.count('page_cache', result='miss')
+
+		# only cache successful responses
+		if r.status_code == 200:
+			self._write(body_path, r.content)
+			self._write(meta_path, json.dumps({'url': url, 'etag': r.headers.get('ETag'), 
+									'last_modified': r.headers.get('Last-Modified'), 
+										'encoding': r.encoding, 'fetched_at': time.time()}).encode())
+
+		return r.content
+
+	def expire(self, url):
+
+		'''
+		make the next request for url go to the server (conditionally) and forget its parsed documents
+		'''
+
+		meta = self._read_meta(url)
+
+		if meta:
+			meta['fetched_at'] = 0
+			self._write(self._paths(url)[1], json.dumps(meta).encode())
+
+		with self._docs_lock:
+			for k in [k for k in self._docs if k[0] == url]:
+				del self._docs[k]
+
+	def _query_titles(self, titles, api_url, batch, **params):
+
+		'''
+		asks the MediaWiki API about batch titles at a time, following redirects; yields (title, final title, 
+		page or None) for every title. titles in failed batches are left out
+		'''
+
+		for i in range(0, len(titles), batch):
+
+			these_titles = titles[i:i + batch]
+
+			try:
+				q = self._fetch(api_url + '?' + urlencode({'action': 'query', 'titles': '|'.join(these_titles), 'redirects': 1, 
+									'format': 'json', 'formatversion': 2, **params})).json().get('query', {})
+			except (requests.RequestException, ValueError) as e:
+				print(f'\ncan\'t query titles: {e}')
+				continue
+
+			renamed = {r['from']: r['to'] for r in q.get('normalized', []) + q.get('redirects', [])}
+			pages = {p['title']: p for p in q.get('pages', []) if not p.get('missing')}
+
+			for t in these_titles:
+				final_t = t
+				for _ in range(3):   # normalised title, then redirect target
+					final_t = renamed.get(final_t, final_t)
+				yield (t, final_t, pages.get(final_t))
+
+	def page_info(self, urls, api_url=None, batch=50):
+
+		'''
+		returns {url: {'url': canonical url, 'revid': .., 'pageprops': {..}, 'coordinates': {'lat': .., 'lng': ..} or None},..} 
+		for wikipedia page urls, asking the MediaWiki API about batch titles at a time; redirects are followed. pages 
+		that don't exist or couldn't be asked about are None. what's found is also kept in self.info
+		'''
+
+		titles = {url: wiki_title(url) for url in urls}
+		pages = {t: (final_t, page) for t, final_t, page in self._query_titles(list(dict.fromkeys(titles.values())), 
+														api_url or self.api_url, batch, prop='revisions|pageprops|coordinates', 
+															rvprop='ids', colimit='max') if page}
+		info = {}
+
+		for url, t in titles.items():
+
+			if t not in pages:
+				info[url] = None
+				continue
+
+			final_t, page = pages[t]
+			coords = page.get('coordinates')
+
+			info[url] = {'url': canonical_wiki_url(wiki_url(final_t, urlparse(url).netloc)), 
+							'revid': page['revisions'][0]['revid'] if page.get('revisions') else None, 
+								'pageprops': page.get('pageprops', {}), 
+									'coordinates': {'lat': str(coords[0]['lat']), 'lng': str(coords[0]['lon'])} if coords else None}
+
+			self.info[info[url]['url']] = info[url]
+
+		return info
+
+	def revision_ids(self, urls, api_url=None, batch=50):
+
+		'''
+		returns {url: id of the current revision of the wikipedia page at url,..}, None for pages it can't be found for
+		'''
+
+		return {url: i['revid'] if i else None for url, i in self.page_info(urls, api_url, batch).items()}
+
+	def canonical_urls(self, urls, api_url=None, batch=50):
+
+		'''
+		returns {url: canonical url,..} for wikipedia page urls: see canonical_wiki_url, plus redirects followed 
+		(using page_info or the dump). answers are remembered; urls that can't be resolved keep their normalised form
+		'''
+
+		normalised = {url: canonical_wiki_url(url) for url in urls}
+		todo = [url for url in dict.fromkeys(normalised.values()) if (url not in self._canonical) and ('/wiki/' in urlparse(url).path)]
+
+		if todo:
+
+			if hasattr(self.fetcher, 'resolve'):
+				final = {url: self.fetcher.resolve(wiki_title(url)) for url in todo}
+				final = {url: canonical_wiki_url(wiki_url(t, urlparse(url).netloc)) for url, t in final.items() if t}
+			elif getattr(self.fetcher, 'remote', True):
+				final = {url: i['url'] for url, i in self.page_info(todo, api_url, batch).items() if i}
+			else:
+				final = {}
+
+			for url in todo:
+				self._canonical[url] = final.get(url, url)
+
+		return {url: self._canonical.get(n, n) for url, n in normalised.items()}
+
+	def prefetch(self, urls):
+
+		'''
+		download all urls not in the disk cache yet concurrently; the get_* stages then only 
+		hit the disk cache. failures are left for the stage to run into
+		'''
+
+		def _get(url):
+			try:
+				self.get_content(url)
+			except requests.RequestException as e:
+				print(f'\ncan\'t prefetch {url}: {e}')
+
+		with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+			list(ex.map(_get, list(dict.fromkeys(urls))))
+
+		return self
+
+	def get_html(self, url):
+
+		content = self.get_content(url)
+		meta = self._read_meta(url) or {}
+
+		return content.decode(meta.get('encoding') or 'utf-8', errors='replace')
+
+	def _cached_doc(self, k, build):
+
+		# pipeline stages parse on different threads
+		with self._docs_lock:
+
+			if k in self._docs:
+				self._docs.move_to_end(k)
+				metrics.count('doc_cache', result='hit')
+				return self._docs[k]
+
+			metrics.count('doc_cache', result='miss')
+
+			with metrics.timer('page_parse', url=k[0], parser=k[1], region='+'.join([k[2]] if isinstance(k[2], str) else (k[2] or ['all']))):
+				doc = build()
+
+			self._docs[k] = doc
+
+			if len(self._docs) > self.max_docs:
+				self._docs.popitem(last=False)
+
+			return doc
+
+	def get_regions(self, url):
+
+		'''
+		returns the page_regions of the page at url and its lxml tree
+		'''
+
+		tree = self._cached_doc((url, 'lxml-tree', None), lambda: lxml_html.document_fromstring(self.get_html(url)))
+
+		# one walk finds the regions for all stages
+		return (self._cached_doc((url, 'regions', None), lambda: page_regions(tree)), tree)
+
+	def _region_html(self, url, region):
+
+		regions, tree = self.get_regions(url)
+
+		return region_html(tree, region, regions)
+
+	def get_soup(self, url, parser='html.parser', region=None):
+
+		'''
+		returns a parsed page; all get_* stages share the same parsed document. if region is one of PAGE_REGIONS 
+		(or a tuple of them), only that part of the page is turned into a (much smaller) soup, with the lxml backend
+		'''
+
+		if region:
+			return self._cached_doc((url, 'lxml', region), lambda: bs4.BeautifulSoup(self._region_html(url, region), 'lxml'))
+
+		return self._cached_doc((url, parser, None), lambda: bs4.BeautifulSoup(self.get_html(url), parser))
+
+
+class ColourPalette:
+
+	'''
+	CSS3 colour names with their coordinates precomputed in rgb or CIE Lab space (space='lab' 
+	gives perceptually closer names); nearest() names any number of colours with one 
+	broadcasted distance computation
+	'''
+
+	# sRGB (D65) to XYZ
+	RGB_TO_XYZ = np.array([[0.4124, 0.3576, 0.1805], 
+							[0.2126, 0.7152, 0.0722], 
+								[0.0193, 0.1192, 0.9505]])
+	WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+	def __init__(self, space='rgb'):
+
+		if space not in ('rgb', 'lab'):
+			raise Exception(f'colour space {space} is not supported, use rgb or lab')
+
+		self.space = space
+
+		# reversed so that, as before, ties go to the last name in CSS3_HEX_TO_NAMES
+		css3 = list(webcolors.CSS3_HEX_TO_NAMES.items())[::-1]
+
+		self.names = [name for _, name in css3]
+		self.coords = self._to_space(np.array([webcolors.hex_to_rgb(h) for h, _ in css3], dtype=float))
+
+	def _to_space(self, rgb):
+
+		if self.space == 'rgb':
+			return rgb
+
+		c = rgb/255.
+		c = np.where(c > 0.04045, ((c + 0.055)/1.055)**2.4, c/12.92)
+
+		xyz = c @ self.RGB_TO_XYZ.T/self.WHITE_D65
+		f = np.where(xyz > (6/29)**3, np.cbrt(xyz), xyz/(3*(6/29)**2) + 4/29)
+
+		return np.stack([116*f[:,1] - 16, 500*(f[:,0] - f[:,1]), 200*(f[:,1] - f[:,2])], axis=1)
+
+	def nearest(self, colours):
+
+		'''
+		colours are hex strings or rgb triplets; returns the nearest CSS3 colour name for each
+		'''
+
+		if not len(colours):
+			return []
+
+		rgb = np.array([webcolors.hex_to_rgb(c) if isinstance(c, str) else c for c in colours], dtype=float)
+
+		dists = ((self._to_space(rgb)[:, None, :] - self.coords[None, :, :])**2).sum(axis=2)
+
+		return [self.names[i] for i in dists.argmin(axis=1)]
+
+
+class BaseSportDBCreator(metaclass=ABCMeta):
+
+	@abstractmethod
+	def _is_sport_supported(self):
+		'''
+		check that we can create database for this sport
+		'''
+		pass
+
+class SportDBCreator(BaseSportDBCreator):
+
+	# stages that read the team page: {stage: (state key, scraper, page region),..}
+	TEAM_PAGE_STAGES = {'get_team_info': ('info', '_scrape_team_infobox', 'infobox'), 
+						'get_team_sponsors': ('sponsors', '_scrape_team_sponsors', 'sponsors'),
+						'get_int_profile': ('squad', '_scrape_squad', 'squad'),
+						'get_team_colors': ('colours', '_scrape_team_colors', 'colours')}
+
+	# club websites: (connect, read) timeouts and a deadline in seconds, and how much of a page to read at most
+	SOCIALS_TIMEOUT = (3.05, 10)
+	SOCIALS_DEADLINE = 20
+	SOCIALS_MAX_BYTES = 2*1024*1024
+
+	def _is_sport_supported(self):
+
+		if self.sport not in self.team_urls:
+			return False
+		else:
+			return True
+
+	def _setup_processors(self):
+
+		self.processors = {'team': 
+							{"full name": lambda _: _.split("[")[0],
+							"nickname(s)":  lambda _: [nick.split("[")[0].strip() for nick in _.split(",")],  # nicknames are comma separated
+							"founded": lambda _: str(arrow.get(_.split(";")[0], "YYYY").year),
+							"ground": lambda _: [g.split('(')[0].strip() for g in _.split('\n')],   	# if multiple, they come in separate lines
+							"ground capacity": lambda _: ''.join([c for c in _ if c.isdigit() or c.isspace()]).split(),
+							'history': lambda _: [w.strip() for w in _.split('\n') if len([p for p in w if p.isdigit()]) < 4],
+							'arena': lambda _: [w.strip() for w in _.split('\n') if len([p for p in w if p.isdigit()]) < 4],
+							'arena capacity': lambda _: [w for w in _.replace(',','').split() if w.isdigit()],
+							'location': lambda _: _.replace("\n", ' '),
+							'team colors': lambda _: [w.strip() for w in _.split(',')]}, 
+							'sponsor': lambda _: _.split('[')[0].split('(')[0].strip(),	
+							"venue": {"former names": lambda _: [g.split('(')[0].strip() for g in _.split('\n')],
+										"owner": lambda _: [g.split('(')[0].strip() for g in _.split('\n')],
+										"operator": lambda _: [g.split('(')[0].strip() for g in _.split('\n')],
+										# "capacity": lambda _: _.split("[")[0],
+										"field size": lambda _: 'x'.join([c for c in _.split() if c.isdigit()]),
+										"opened": lambda _: str(arrow.get(_.split(";")[0], "YYYY").year),
+										"location": lambda _: ','.join([w.strip() for w in _.split('\n')]),
+										"surface": lambda _: _,
+										"expanded": lambda _: _,
+										"renovated": lambda _: _,}}
+
+
+		return self
+
+
+	def __init__(self, sport, pages=None, colour_space='rgb', logo_max_side=None, partial_parsing=True, parse_workers=1, 
+					incremental=False, teams=None, state_tag='', stages=None, stream_dir=None):
+
+		print('initializing class...', end='')
+
+		# do we have DATA directory? if we do, what about the team url files? if no directory exists, throw error
+		if not os.path.isdir('data'):
+			raise Exception('data directory is absent!')
+
+		# try to read the team wiki urls file
+		try:
+			self.team_urls = json.load(open('data/team-wiki-urls.json','r'))
+		except:
+			raise Exception('you need to have a file with team wikipedia urls in data directory!')
+
+		self.sport = sport
+
+		if not self._is_sport_supported():
+			raise Exception(f'sport {self.sport} is not currently supported, come back later..')
+
+		# only build some of the teams, e.g. one shard
+		if teams is not None:
+			self.team_urls[self.sport] = {t: u for t, u in self.team_urls[self.sport].items() if t in set(teams)}
+
+		self._setup_processors()
+
+		# all stages get their pages from here so that each page is only downloaded and parsed once
+		self.pages = pages if pages else PageCache()
+		self.partial_parsing = partial_parsing
+		self.parse_workers = parse_workers
+
+		self.incremental = incremental
+		self.state_tag = state_tag
+
+		if self.incremental:
+			self._load_state()
+
+		self.colour_space = colour_space
+		self.palette = None    # made on first use, see _scrape_team_colors
+
+		self.logo_max_side = logo_max_side
+		self.logo_colours = {}    # {logo content hash: most common colours,..}
+
+		self.socials_of_interest = 'facebook instagram youtube twitter'.split()
+
+		# club websites get their own fetcher: no retries, so that SOCIALS_DEADLINE covers the whole request
+		self.site_fetcher = HTTPFetcher(timeout=self.SOCIALS_TIMEOUT, retries=0, pool_size=self.pages.max_workers)
+
+		# prepopulate containers for collected data
+		self.team_index = {team: {"name": team, "sport": self.sport, "wiki_url": self.team_urls[self.sport][team]} for team in self.team_urls[self.sport]}
+		self.venue_data = []
+		self.venue_index = {}    # {venue id: venue record,..}, one for each venue however many teams play there
+
+		# stages left to run for each team; once none are, the team record is final
+		self.stages = stages
+		self._stages_left = {team: set(stages) for team in self.team_index} if stages else {}
+
+		# in streaming mode, finished records are appended to jsonl files and dropped from memory
+		self.stream_dir = stream_dir
+		self._jsonl = {}
+
+		# in pipeline mode, stages finish teams and add venues from different threads
+		self._lock = threading.RLock()
+
+		if self.stream_dir:
+
+			if not stages:
+				raise Exception('streaming output needs to know what stages will run!')
+
+			if not os.path.isdir(self.stream_dir):
+				os.makedirs(self.stream_dir)
+
+			for kind in ['teaminfo', 'venueinfo']:
+				self._jsonl[kind] = open(os.path.join(self.stream_dir, kind + '-' + self.sport.replace(' ','').upper() + '.jsonl'), 'w')
+
+		print('ok')
+
+		self.GROUND_SYNS = {'ground', 'complex', 'oval', 'hub', 'park', 'showgrounds', 'stadium', 
+								'field', 'reserve', 'estadio', 'club', 'sport', 'arena', 'sports', 'the', 'centre', 'center'}
+		self.LEAGUE_NMS = {'npl': 'national premier leagues', 'afl': 'australian football league',
+								'nbl': 'national basketball league'}
+
+		self.RE_YEAR = re.compile(r'\d{4}')
+		self.RE_COLOR = re.compile('(?<=\")[a-zA-Z ]+(?=\")')
+
+	@property
+	def team_data(self):
+
+		return list(self.team_index.values())
+
+	def close(self):
+
+		'''
+		close the jsonl files of streaming mode
+		'''
+
+		for f in self._jsonl.values():
+			f.close()
+
+		return self
+
+	def _write_jsonl(self, kind, rec):
+
+		self._jsonl[kind].write(json.dumps(rec) + '\n')
+		self._jsonl[kind].flush()
+
+	def _stage_done(self, team, stage):
+
+		'''
+		mark stage as done for team; when streaming, the record is written out as soon as its last stage is done
+		'''
+
+		with self._lock:
+
+			if team not in self._stages_left:
+				return
+
+			self._stages_left[team].discard(stage)
+
+			if (not self._stages_left[team]) and self.stream_dir:
+				del self._stages_left[team]
+				self._write_jsonl('teaminfo', self.team_index.pop(team))
+
+	def _add_venue(self, venue_record):
+
+		with self._lock:
+
+			self.venue_index[venue_record['venue_id']] = venue_record
+
+			if self.stream_dir:
+				self._write_jsonl('venueinfo', venue_record)
+			else:
+				self.venue_data.append(venue_record)
+
+	def _resolve_grounds(self, recs):
+
+		'''
+		points the grounds of team records at canonical venue urls and gives them venue ids, so that a venue 
+		linked to in different ways (or by teams of other sports) is one venue
+		'''
+
+		grounds = [r for rec in recs for r in (rec.get('ground') or [])]
+		canonical = self.pages.canonical_urls([r['wiki_url'] for r in grounds])
+
+		for rec in recs:
+			if rec.get('ground'):
+				rec['ground'] = [{**r, 'wiki_url': canonical[r['wiki_url']], 'venue_id': venue_id(canonical[r['wiki_url']])} 
+									for r in rec['ground']]
+
+	def _venue_record(self, ground, venue):
+
+		# a team's ground plus what's on its venue page, with state and TEG codes
+		venue_record = {**ground, **venue}
+
+		# pages from the API come with coordinates even if the infobox has none
+		if (not venue_record.get('coordinates')) and self.pages.info.get(ground['wiki_url'], {}).get('coordinates'):
+			venue_record['coordinates'] = self.pages.info[ground['wiki_url']]['coordinates']
+		venue_record.update(tcf.find_teg_code(venue_record))
+
+		return venue_record
+
+	def _scrape_team_infobox(self, team_soup):
+
+		"""
+		team_soup is a soup object for the team
+		returns team information from the team's wikipedia infobox as a dictionary
 		"""
-		team_soup is a soup object for the team
-		returns team information from the team's wikipedia infobox as a dictionary
-		"""
 
-		this_team_info = defaultdict()
+		this_team_info = defaultdict()
+
+		try:
+			ib = team_soup.find("table", class_="infobox")
+		except:
+			raise Exception('can\'t find team infobox on this page!')
+
+		_ths = []
+
+		for row in ib.find_all("tr"):
+			
+			# try to find both 'th' and 'td' that should be in the same row
+			th = row.find('th')
+			td = row.find('td')
+
+			if th:  
+
+				heading = th.text.lower()
+
+				if not th.text.strip():
+					heading = _ths.pop()
+				else:
+					_ths.append(heading)
+
+				k = TEAM_HEADINGS.classify(heading)
+
+				if not k:
+					continue
+				
+				# this th will be our dictionary key
+				# k = th.text.encode('ascii','replace').decode().replace('?',' ').lower().strip()
+
+				if td:  # 2-column scenario
+
+					if k in ['union', 'location']:
+						this_team_info[k] = td.text.replace("\n",' ').lower().strip()
+					elif k == 'league':
+						for l in list({lg.lower().strip().split('(')[0] for lg in td.text.split("\n")}):
+							for rpl in self.LEAGUE_NMS:
+								l = l.replace(rpl, self.LEAGUE_NMS[rpl])
+							if k in this_team_info:
+								this_team_info[k].append(l)
+							else:
+								this_team_info[k] = [l]
+
+					elif k == 'nickname':
+						this_team_info[k] = [nick for nick in list({lg.lower().split('[')[0].split('(')[0].strip() 
+												for lg in re.split(r'[\n;,]\s*', td.text)}) if len(nick) > 1]
+					elif k == 'colours':
+						this_team_info[k] = list(set([l.lower().strip() for l in re.split(r'[\n;,  ]\s*', td.text) if 
+													(':' not in l) and l.strip() not in {'and', '&', ''}]))
+					elif k == 'founded':
+						if self.RE_YEAR.search(td.text):  # avoid empty search results
+							this_team_info[k] = min(self.RE_YEAR.findall(td.text), key=lambda _: int(_))
+						else:
+							this_team_info[k] = None
+					elif k == 'website':
+						this_team_info[k] = row.find('a')["href"]  # grab url not text
+					elif k == 'known_as':
+						this_team_info[k] = [t[0] for t in zip([_.text.strip().lower() for _ in td.find_all('b')], 
+												[line.lower() for line in td.text.split('\n') if re.search(r'\d{4}', line)])
+													if 'present' not in t[1]]
+
+					elif k == 'ground':
+
+						as_ = td.find_all('a', attrs={'title': True})
+
+						_ = []
+
+						if len(as_) == 1:
+							_.append({'name': tn.normalise(as_[0].text.lower().strip()), 'wiki_url': 'https://en.wikipedia.org' + as_[0]['href']})
+						else:
+							for g in as_:
+								if ((set(g.text.replace(',',' ').lower().split()) & self.GROUND_SYNS) or 
+										(set(g['title'].replace(',',' ').replace('_',' ').lower().split()) & self.GROUND_SYNS)):
+									_.append({'name': tn.normalise(g.text.lower().strip()), 'wiki_url': 'https://en.wikipedia.org' + g['href']})
+
+						if k in this_team_info:
+							venue_names_already_there = {v['name'] for v in this_team_info[k]}
+							[this_team_info[k].append(v) for v in _ if v["name"] not in venue_names_already_there]
+						else:
+							this_team_info[k] = _
+					
+				elif th.has_attr('colspan') and (k == 'website'):
+					this_team_info[k] = row.next_sibling.next_sibling.find('a')['href']
+					continue
+
+		return this_team_info
+
+	def _scrape_team_sponsors(self, team_soup):
+
+		
+		def process_sponsors(sponsor_list, sponsor_now=False):
+
+			assert isinstance(sponsor_now, bool), 'incorrestly chosen option - only True or False allowed!'
+
+			if not sponsor_list:
+				return None
+
+			if not sponsor_now:
+				sponsors = {s.lower() for s in sponsor_list[:-1] if s != sponsor_list[-1]}
+				if not sponsors:
+					return None
+			else:
+				sponsors = [sponsor_list[-1]]
+
+			# sponsors may be separates by new line or / or ,
+			sponsors = {z.strip() for s in sponsors 
+						for v in s.split('\n') 
+							for r in v.split('/') 
+								for z in r.split(',') if z.strip() and z.strip().isalnum()}	
+
+			return list(sponsors) if sponsors else None	
+
+
+		this_team_sponsors = defaultdict()
+		this_team_sponsors['sponsors'] = defaultdict()
+		
+		# sponsors are not always sitting in the same section so need to try a few scenarios
+		sp_span = team_soup.find('span', text=re.compile("Sponsorship"), attrs = {'id': 'Sponsorship'})
+	
+		if not sp_span:
+			sp_span = team_soup.find('span', text=re.compile("Sponsors"), attrs = {'id': 'Sponsors'})
+	
+		if not sp_span:
+			sp_span = team_soup.find('span', text="Colours and badge", attrs={'class': 'mw-headline'}) 
+		
+		# maybe there's no sponsor info, then just return an empty dict
+		if not sp_span:
+			return this_team_sponsors
+
+		for sib in sp_span.parent.next_siblings:
+	
+			if sib.name == 'h2':
+				# apparently, no sponsor info, return empty dict
+				return this_team_sponsors
+	
+			if sib.name == 'table':
+
+				kit = []
+				shirt = []
+				other = []
+				
+				for i, row in enumerate(sib.find_all('tr')):
+					
+					if i == 0:    # skip header
+						continue
+
+					if (i == 1) and row.find('th'):
+						continue
+
+					any_tds = row.find_all('td')
+
+					if any_tds:
+
+						for j, td in enumerate(any_tds):
+
+							if j == 0:
+								continue
+
+							try:
+								rpl = int(td['rowspan'])
+							except:
+								rpl = 1
+							
+							# try to add to sponsor types, left to right
+							if len(kit) < i:
+								kit.extend([self.processors['sponsor'](td.text.lower())]*rpl)
+							elif len(shirt) < i:
+								shirt.extend([self.processors['sponsor'](td.text.lower())]*rpl)
+							elif len(other) < i:
+								other.extend([self.processors['sponsor'](td.text.lower())]*rpl)
+	
+				# verify that all sponsor types are the same length
+				if not len(kit) == len(shirt) == len(other):
+					print("some problem with sponsors!")
+
+				break
+
+
+		this_team_sponsors['sponsors']['previous'] = {'kit': process_sponsors(kit), 
+											'shirt': process_sponsors(shirt), 
+												'other': process_sponsors(other)}
+		this_team_sponsors['sponsors']['current'] = {'kit': process_sponsors(kit, sponsor_now=True), 
+											'shirt': process_sponsors(shirt, sponsor_now=True), 
+												'other': process_sponsors(other, sponsor_now=True)}
+
+		return this_team_sponsors
+
+	def _scrape_socials(self, team_website_url):
+
+		'''
+		streams the club website into an incremental parser and stops reading as soon as its social links 
+		block is over, or after SOCIALS_MAX_BYTES; a site that is slow to answer or to send the page is 
+		given up on after SOCIALS_TIMEOUT (connect, read) and SOCIALS_DEADLINE seconds in total. every 
+		socket read waits at most for what's left of the deadline
+		'''
+
+		team_socials = defaultdict()
+
+		target = LinkBlockTarget('social-links')
+		parser = lxml_etree.HTMLParser(target=target)
+
+		t0 = time.perf_counter()
+		status, size = 'error', 0
 
 		try:
-			ib = team_soup.find("table", class_="infobox")
-		except:
-			raise Exception('can\'t find team infobox on this page!')
 
-		_ths = []
+			r = self.site_fetcher.fetch(team_website_url, stream=True, timeout=self.SOCIALS_TIMEOUT)
+			status = r.status_code
+
+			with r:
+
+				# read1 returns what has arrived rather than waiting for a full chunk (urllib3 2)
+				read = getattr(r.raw, 'read1', r.raw.read)
+				sock = getattr(getattr(r.raw, 'connection', None), 'sock', None)
+
+				while not (target.done or (size >= self.SOCIALS_MAX_BYTES)):
+
+					left = self.SOCIALS_DEADLINE - (time.perf_counter() - t0)
+
+					if left <= 0:
+						raise requests.Timeout(f'no social links after {self.SOCIALS_DEADLINE}s')
+
+					if sock:
+						sock.settimeout(min(self.SOCIALS_TIMEOUT[1], left))
+
+					chunk = read(16*1024, decode_content=True)
+
+					if not chunk:
+						break
+
+					parser.feed(chunk)
+					size += len(chunk)
+
+		except (requests.RequestException, urllib3_exceptions.HTTPError, OSError) as e:
+			print(f'\ncan\'t get social links from {team_website_url}: {e}')
+
+		finally:
+			metrics.request(team_website_url, status, size, time.perf_counter() - t0)
+
+		for href in target.links:
+			for soc in self.socials_of_interest:
+				if soc in href:
+					team_socials[soc] = href
+
+		return {'social_media_accounts': team_socials}
+
+	def _scrape_squad(self, team_soup):
+
+		fst_team_span = team_soup.find('span', id='First_team_squad')
+	
+		team_countries = []
+	
+		if not fst_team_span:
+			return team_countries
+		
+		for s in fst_team_span.parent.next_siblings:
+		
+			if s.name == 'table':
+		
+				# find the very first td
+				tr = s.find('tr')
+	
+				for flag in tr.find_all('span', class_="flagicon"):
+					team_countries.append(flag.find('a')["title"].lower())
+		
+				return {"player_citizenships": Counter(team_countries)}
+
+		return team_countries
+
+	def _logo_colours(self, logo_url, n=5):
+
+		'''
+		returns the n most common rgb colours of the logo at logo_url; the image is decoded in memory 
+		(optionally downscaled so that its longer side is at most self.logo_max_side) and the colours 
+		are remembered by content hash
+		'''
+
+		content = self.pages.get_content(logo_url)
+
+		if not content:   # e.g. not in an offline dump
+			return []
+
+		k = hashlib.sha1(content).hexdigest()
+
+		if k in self.logo_colours:
+			metrics.count('logo_cache', result='hit')
+			return self.logo_colours[k]
+
+		metrics.count('logo_cache', result='miss')
+
+		with metrics.timer('logo_decode', url=logo_url):
+			self.logo_colours[k] = self._count_logo_colours(content, n)
+
+		return self.logo_colours[k]
+
+	def _count_logo_colours(self, content, n):
+
+		i1 = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+
+		if i1 is None:   # not an image opencv can read (e.g. svg)
+			return []
+
+		if self.logo_max_side and (max(i1.shape[:2]) > self.logo_max_side):
+			scale = self.logo_max_side/max(i1.shape[:2])
+			# nearest neighbour doesn't blend pixels, i.e. doesn't make up new colours
+			i1 = cv2.resize(i1, (max(1, round(i1.shape[1]*scale)), max(1, round(i1.shape[0]*scale))), 
+								interpolation=cv2.INTER_NEAREST)
+
+		# pack each bgr pixel into a single rgb integer and count them all at once
+		px = i1.reshape(-1, 3).astype(np.uint32)
+		rgb_ints, first_seen, counts = np.unique((px[:,2] << 16) | (px[:,1] << 8) | px[:,0], 
+													return_index=True, return_counts=True)
+
+		# most common first, ties in order of appearance (same as Counter.most_common)
+		top = np.lexsort((first_seen, -counts))[:n]
+
+		return [(int(v) >> 16, (int(v) >> 8) & 255, int(v) & 255) for v in rgb_ints[top]]
+
+	def _scrape_team_colors(self, team_soup):
+
+		team_colors = defaultdict(lambda: defaultdict(list))
+
+		# background colors first (kit)
+		imgs = team_soup.find('td', attrs={'class': 'toccolours'})
+
+		kit_hexs = []
+		
+		if imgs:
+
+			hexs = []
+
+			for ss in imgs.find_all('div', style=re.compile('background-color')):
+
+				colcode = ss["style"].split('background-color:')[-1].replace(';','').strip()
+
+				if len(colcode) == 7:
+					hexs.append(colcode)
+
+			kit_hexs = [t[0] for t in Counter(hexs).most_common(5)]
+
+		# team logos
+
+		im_logo = team_soup.find('a', class_='image')
+
+		logo_rgbs = self._logo_colours('https:' + im_logo.find('img')['src'])
+
+		if self.palette is None:
+			self.palette = ColourPalette(space=self.colour_space)
+
+		# name all kit and logo colours in one go
+		names = self.palette.nearest(kit_hexs + logo_rgbs)
+
+		if imgs:
+
+			team_colors['kit']['hex'] = kit_hexs
+			team_colors['kit']['name'] = list(set(names[:len(kit_hexs)]))
+
+		team_colors['logo']['hex'] = [webcolors.rgb_to_hex(rgb) for rgb in logo_rgbs]
+		team_colors['logo']['name'] = list(set(names[len(kit_hexs):]))
+
+		return {"team_colors": team_colors}
+
+	def _scrape_venues(self, venue_soup):
+
+		venue_data = defaultdict()
+		
+		venue_infobox = venue_soup.find('table', class_='infobox')	
+
+		if not venue_infobox:
+			return venue_data	
 
-		for row in ib.find_all("tr"):
+		for row in venue_infobox.find_all("tr"):
 			
 			# try to find both 'th' and 'td' that should be in the same row
 			th = row.find('th')
@@ -214,484 +2383,935 @@ class SportDBCreator(BaseSportDBCreator):
 
 				heading = th.text.lower()
 
-				if not th.text.strip():
-					heading = _ths.pop()
-				else:
-					_ths.append(heading)
-
-				if 'union' in heading:
-					k = 'union'
-				elif 'nick' in heading:
-					k = 'nickname'
-				elif 'locat' in heading:
-					k = 'location'
-				elif (('ground' in heading) or ('arena' in heading)) and ('capacity' not in heading):
-					k = 'ground'
-				elif (('league' in heading) or ('competition' in heading)) and (len(heading.split()) < 3):
-					k = 'league'
-				elif 'website' in heading:
-					k = 'website'
-				elif 'history' in heading:
-					k = 'known_as'
-				elif 'colo' in heading:
-					k = 'colours'
-				else:
+				k = VENUE_HEADINGS.classify(heading)
 
+				if not k:
 					continue
-				
-				# this th will be our dictionary key
-				# k = th.text.encode('ascii','replace').decode().replace('?',' ').lower().strip()
 
 				if td:  # 2-column scenario
+	
+					if k in ['location']:
+						venue_data[k] = td.text.replace("\n",' ').lower().strip().split('(')[0]
+					elif k == 'established':
+						venue_data[k] = self.RE_YEAR.search(td.text).group(0)
+					elif k == 'capacity':
+						venue_data[k] = re.search(r'\d+,*\d+', td.text).group(0).replace(',','')
+					elif k == 'coordinates':
+						_ = td.find('span', class_='geo-dec').parent.find('span', class_='geo').text.split(';')
+						venue_data[k] = {'lat': _[0].strip(), 'lng': _[1].strip()}
+					elif k == 'owner':
+						venue_data[k] = [v.lower().split('(')[0].strip() for v in re.split(r'[\n;,]\s*', td.text) if v.strip()]
+					elif k == 'known_as':
+						venue_data[k] = [v.lower().split('(')[0].strip() for v in re.split(r'[\n;,]\s*', td.text) if v.strip()]
+						# also try to find more former or alternative names in the first paragraph of main text where these would be in bold
+					else:
+						pass
 
-					if k in ['union', 'location']:
-						this_team_info[k] = td.text.replace("\n",' ').lower().strip()
-					elif k == 'league':
-						for l in list({lg.lower().strip().split('(')[0] for lg in td.text.split("\n")}):
-							for rpl in self.LEAGUE_NMS:
-								l = l.replace(rpl, self.LEAGUE_NMS[rpl])
-							if k in this_team_info:
-								this_team_info[k].append(l)
-							else:
-								this_team_info[k] = [l]
+		for s in venue_infobox.next_siblings:
+			if s.name == 'p':
+				for b in s.find_all('b'):
+					text_in_bold = b.text.lower().strip()
+					if 'known_as' not in venue_data:
+						if len(text_in_bold) > 1:
+							venue_data['known_as'] = [text_in_bold]
+					else:
+						if ((len(text_in_bold) > 1) and 
+								(text_in_bold not in venue_data['known_as'])):
+							venue_data['known_as'].append(text_in_bold)
+				break  # consider only the very first paragraph
+
+
+		return venue_data
+
+	def _scrape_team_page(self, team_soup):
+
+		'''
+		runs the scrapers of all team page stages in self.stages on one soup, which in partial parsing mode 
+		has all their regions, each in its own div; returns {stage: record,..}
+		'''
+
+		parts = {div['data-region']: div for div in (team_soup.body or team_soup).find_all('div', attrs={'data-region': True}, recursive=False)}
+
+		recs = {}
+
+		for stage in self._team_page_stages():
+
+			_, scraper, region = self.TEAM_PAGE_STAGES[stage]
+
+			with metrics.stage(stage):
+				recs[stage] = getattr(self, scraper)(parts.get(region, team_soup))
+
+		return recs
+
+	def _team_page_stages(self):
+
+		return [stage for stage in self.TEAM_PAGE_STAGES if stage in (self.stages or [])]
+
+	def _prefetch_logos(self, page_urls):
+
+		'''
+		download the logos on the team pages at page_urls (found with page_regions, without making soups), 
+		so that scraping colours only hits the disk cache
+		'''
+
+		logo_urls = []
+
+		for url in page_urls:
+			try:
+				logo_urls.append(logo_url(self.pages.get_regions(url)[0]))
+			except Exception:
+				# left for the colours stage to run into
+				pass
+
+		self.pages.prefetch(u for u in logo_urls if u)
+
+	def _soup(self, url, region):
+
+		'''
+		in partial parsing mode, only the page region a scraper reads is parsed
+		'''
+
+		return self.pages.get_soup(url, region=region if self.partial_parsing else None)
+
+	def _extract_pages(self, scraper, urls, region, parallel=True, labels=None):
+
+		'''
+		runs scraper on the pages at urls and returns the records, as plain dicts, in the order of urls; with 
+		parse_workers > 1 the pages are parsed and scraped on a (forked) process pool. the time taken by each 
+		page is recorded with labels (one dict per url, by default its url)
+		'''
+
+		urls = list(urls)
+		labels = labels or [{'url': url} for url in urls]
+
+		if (not parallel) or (self.parse_workers < 2) or ('fork' not in mp.get_all_start_methods()):
+
+			recs = []
+
+			for url, label in zip(urls, labels):
+				with metrics.timer('extract', scraper=scraper, **label):
+					recs.append(plain(getattr(self, scraper)(self._soup(url, region))))
+
+			return recs
+
+		region = region if self.partial_parsing else None
+		jobs = ((scraper, self.pages.get_html(url), region) for url in urls)
+
+		with ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=mp.get_context('fork'), 
+									initializer=_init_extractor, initargs=(self,)) as ex:
+			results = list(ex.map(_extract, jobs, chunksize=max(1, len(urls)//(4*self.parse_workers))))
+
+		for url, label, (_, parsed, extracted) in zip(urls, labels, results):
+			metrics.observe('page_parse', *parsed, url=url, parser='lxml' if region else 'html.parser', region=region or 'all')
+			metrics.observe('extract', *extracted, scraper=scraper, **label)
+
+		return [rec for rec, _, _ in results]
+
+	def _load_state(self):
+
+		'''
+		in incremental mode, what was extracted from each page on the last run is kept in a state file along with 
+		the page revision id and content hash
+		'''
+
+		self.state_path = 'state-' + self.sport.replace(' ','').upper() + self.state_tag + '.json'
+
+		try:
+			self.prev_state = json.load(open(self.state_path, 'r'))
+		except (OSError, ValueError):
+			self.prev_state = {'teams': {}, 'venues': {}}
+
+		self.state = {'teams': {}, 'venues': {}}
+		self.changed = {'teams': set(), 'venues': set()}
+		self.revids = {}    # {url: current revision id,..}
+
+		return self
+
+	def _page_state(self, kind, key, url):
+
+		'''
+		returns this run's state entry for a team or venue page; if the page hasn't changed since the last run, 
+		the entry starts with everything extracted from it last time
+		'''
+
+		if key in self.state[kind]:
+			return self.state[kind][key]
+
+		prev = self.prev_state[kind].get(key)
+		revid = self.revids.get(url)
+		fresh = False    # just downloaded
+
+		if prev and revid and prev.get('revid'):
+			unchanged = (revid == prev['revid'])
+		elif prev:
+			# no revision id to go by, compare content instead
+			self.pages.expire(url)
+			unchanged = (hashlib.sha1(self.pages.get_content(url)).hexdigest() == prev.get('sha1'))
+			fresh = True
+		else:
+			unchanged = False
+
+		if unchanged:
+			entry = {**prev, 'stages': dict(prev['stages'])}
+		else:
+			# make sure the page itself is downloaded again rather than served from the disk cache
+			if not fresh:
+				self.pages.expire(url)
+			self.changed[kind].add(key)
+			entry = {'wiki_url': url, 'revid': revid, 'sha1': None, 'stages': {}}
+
+		self.state[kind][key] = entry
+
+		return entry
+
+	def _scrape_pages(self, kind, stage, scraper, region, keys_urls, parallel=True):
+
+		'''
+		runs scraper on the pages in keys_urls, a list of (team name or venue url, page url), and returns 
+		the records in the same order; in incremental mode, records for unchanged pages come from the state file
+		'''
+
+		# time pages by team name or venue url
+		label = kind.rstrip('s')
+
+		if not self.incremental:
+			self.pages.prefetch(url for _, url in keys_urls)
+			return self._extract_pages(scraper, [url for _, url in keys_urls], region, parallel=parallel, 
+										labels=[{label: k} for k, _ in keys_urls])
+
+		new_urls = [url for _, url in keys_urls if url not in self.revids]
+
+		if new_urls:
+			self.revids.update(self.pages.revision_ids(new_urls))
+
+		todo = [(k, url) for k, url in dict.fromkeys(keys_urls) if stage not in self._page_state(kind, k, url)['stages']]
+
+		self.pages.prefetch(url for _, url in todo)
+
+		for (k, url), rec in zip(todo, self._extract_pages(scraper, [url for _, url in todo], region, parallel=parallel, 
+															labels=[{label: k} for k, _ in todo])):
+
+			entry = self.state[kind][k]
+
+			html = self.pages.get_html(url)
+			rev_in_page = re.search(r'"wgRevisionId":(\d+)', html)
+
+			entry['sha1'] = hashlib.sha1(self.pages.get_content(url)).hexdigest()
+			entry['revid'] = entry['revid'] or (int(rev_in_page.group(1)) if rev_in_page else None)
+			entry['stages'][stage] = plain(rec)
+
+		return [self.state[kind][k]['stages'][stage] for k, _ in keys_urls]
+
+	def _scrape_teams(self, stage, scraper, region, parallel=True):
+
+		teams = list(self.team_urls[self.sport])
+
+		return zip(teams, self._scrape_pages('teams', stage, scraper, region, 
+												[(t, self.team_urls[self.sport][t]) for t in teams], parallel=parallel))
+
+	def save_state(self):
+
+		'''
+		write the state file for the next incremental run and a delta file listing teams and venues 
+		added, changed or removed since the last run
+		'''
+
+		# only what this run can tell is gone counts as removed: teams no longer listed and, if venues 
+		# were collected, venues no team plays at any more. pages this run didn't visit are kept as they were
+		gone = {'teams': set(self.prev_state['teams']) - set(self.team_urls[self.sport]), 
+				'venues': (set(self.prev_state['venues']) - set(self.state['venues'])) if 'get_team_venues' in (self.stages or []) else set()}
+
+		state = {kind: {**{k: v for k, v in self.prev_state[kind].items() if k not in gone[kind]}, **self.state[kind]} 
+					for kind in ['teams', 'venues']}
+
+		delta = {}
+
+		for kind in ['teams', 'venues']:
+			delta[kind] = {'added': sorted(set(self.state[kind]) - set(self.prev_state[kind])),
+							'changed': sorted(self.changed[kind] & set(self.prev_state[kind])),
+								'removed': sorted(gone[kind])}
+
+		json.dump(state, open(self.state_path, 'w'))
+		json.dump(delta, open('delta-' + self.sport.replace(' ','').upper() + self.state_tag + '.json', 'w'), indent=2)
+
+		return self
+
+	def get_team_info(self):
+
+		for team, info in self._scrape_teams(*self.TEAM_PAGE_STAGES['get_team_info']):
+			print(f'collecting basic team info for {team.upper()}...', end='')
+			self.team_index[team].update(info)
+			self._stage_done(team, 'get_team_info')
+			print('ok')
+
+		return self
+
+	def get_team_venues(self):
+
+		self._resolve_grounds([self.team_index[team] for team in self.team_urls[self.sport]])
+
+		# each venue is scraped and matched to TEG codes once, for the first team playing there
+		first_grounds = {}    # {venue id: ground,..}
+
+		for team in self.team_urls[self.sport]:
+			for r in (self.team_index[team].get('ground') or []):
+				first_grounds.setdefault(r['venue_id'], r)
+
+		venues = self._scrape_pages('venues', 'venue', '_scrape_venues', 'infobox', 
+										[(r['wiki_url'], r['wiki_url']) for r in first_grounds.values()])
+		venues = {r['venue_id']: (r, venue) for r, venue in zip(first_grounds.values(), venues)}
+
+		for team in self.team_urls[self.sport]:
+			print(f'collecting venue info for {team.upper()}...', end='')
+			with metrics.timer('team', stage='get_team_venues', team=team):
+				for r in (self.team_index[team].get('ground') or []):
+					if r['venue_id'] in venues:
+						self._add_venue(self._venue_record(*venues.pop(r['venue_id'])))
+
+			self._stage_done(team, 'get_team_venues')
+
+			print('ok')
+
+		return self
+
+	def get_team_sponsors(self):
+
+		print('collecting team sponsors...', end='')
+
+		for team, sponsors in self._scrape_teams(*self.TEAM_PAGE_STAGES['get_team_sponsors']):
+
+			self.team_index[team].update(sponsors)
+			self._stage_done(team, 'get_team_sponsors')
+
+		print('ok')
+
+		return self
+
+	def get_int_profile(self):
+
+		print('collecting player citizenships...', end='')
+
+		for team, squad in self._scrape_teams(*self.TEAM_PAGE_STAGES['get_int_profile']):
+
+			self.team_index[team].update(squad)
+			self._stage_done(team, 'get_int_profile')
+
+		print('ok')
+
+		return self
+
+	def get_team_colors(self):
+
+		print('collecting team colors...', end='')
+
+		self._prefetch_logos(self.team_urls[self.sport].values())
+
+		# logo colours are remembered in self.logo_colours, so this one stays in-process
+		for team, colors in self._scrape_teams(*self.TEAM_PAGE_STAGES['get_team_colors'], parallel=False):
+
+			self.team_index[team].update(colors)
+			self._stage_done(team, 'get_team_colors')
+
+		print('ok')
+
+		return self
+
+
+	def get_team_social_media(self):
+
+		print('collecting team social media account info...', end='')
+
+		def _socials(team):
+
+			rec = self.team_index[team]
+
+			if rec.get('website'):
+				with metrics.timer('team', stage='get_team_social_media', team=team):
+					rec.update(self._scrape_socials(rec['website']))
+
+			self._stage_done(team, 'get_team_social_media')
+
+		# club sites are slow and all different hosts, so they are fetched side by side
+		with ThreadPoolExecutor(max_workers=self.pages.max_workers) as ex:
+			list(ex.map(_socials, list(self.team_urls[self.sport])))
+
+		print('ok')
+
+		return self
+
+	def run_pipeline(self, fetch_workers=8, queue_size=16):
+
+		'''
+		runs self.stages with each team flowing through on its own: team page (and logo) download -> team page stages -> 
+		grounds (resolved for the teams waiting, in one go) -> venue page download -> venue scraping -> output 
+		(when streaming). stages are threads connected by bounded queues, so downloads overlap with parsing 
+		(which runs on one thread for team pages and one for venues). a venue record and its TEG codes are made 
+		from the first team playing there, like the stage by stage build does, as soon as that team is known: 
+		when its page is scraped and all teams before that one have been through grounds
+		'''
+
+		team_stages = self._team_page_stages()
+		team_regions = tuple(self.TEAM_PAGE_STAGES[stage][2] for stage in team_stages)
+		venues = 'get_team_venues' in self.stages
+		socials = 'get_team_social_media' in self.stages
+		colours = 'get_team_colors' in team_stages
+
+		team_pos = {team: i for i, team in enumerate(self.team_urls[self.sport])}
+
+		grounds_left = {}    # {team: grounds whose venues aren't done yet,..}
+		first_ground = {}    # {venue id: ((team position, ground position), team, ground) of the first ground there,..}
+		scraped = {}         # {venue id: what's on the venue page,..}, until its record is made
+
+		# venues waiting for their record, by first ground position: [(position, venue id),..] as a heap, with 
+		# entries left behind when a venue turns out to have an earlier ground; teams before position 
+		# grounded_upto have all been through grounds
+		waiting = []
+		grounded = set()
+		grounded_upto = 0
+		settle_lock = threading.Lock()
+
+		def settle(emit, team=None):
+
+			nonlocal grounded_upto
+
+			# venues are passed on in first ground order, as soon as no team before theirs can still claim them
+			with settle_lock:
+
+				if team is not None:
+					grounded.add(team_pos[team])
+					while grounded_upto in grounded:
+						grounded_upto += 1
+
+				while waiting:
+
+					pos, vid = waiting[0]
+
+					if first_ground[vid][0] != pos:
+						heapq.heappop(waiting)
+						continue
+					if (pos[0] >= grounded_upto) or (vid not in scraped):
+						break
+
+					heapq.heappop(waiting)
+					emit('settled', (first_ground[vid], scraped.pop(vid)))
+
+		def download(url_of, outbox, logos=False):
+
+			def _download(item, emit):
+				try:
+					self.pages.get_content(url_of(item))
+				except requests.RequestException as e:
+					# left for the next stage to run into, like in prefetch
+					print(f'\ncan\'t download {url_of(item)}: {e}')
+				else:
+					# rather than on the one thread parsing team pages
+					if logos:
+						self._prefetch_logos([url_of(item)])
+				emit(outbox, item)
+
+			return _download
+
+		def team_page(team, emit):
+
+			# all team page stages in one go, on a soup of just the regions they read
+			recs = self._extract_pages('_scrape_team_page', [self.team_urls[self.sport][team]], team_regions, parallel=False, 
+										labels=[{'team': team}])[0]
+
+			for stage in team_stages:
+				self.team_index[team].update(recs[stage])
+
+			print(f'collecting team page info for {team.upper()}...ok')
+
+			if venues:
+				emit('parsed', team)
+
+			if socials:
+				emit('socials', team)
+
+			# when streaming, the record is written out (and dropped) after its last stage
+			for stage in team_stages:
+				self._stage_done(team, stage)
+
+		def team_grounds(teams, emit):
+
+			# one canonical_urls call for all teams waiting rather than one each
+			self._resolve_grounds([self.team_index[team] for team in teams])
+
+			for team in teams:
+
+				# a venue shared with a team that came through earlier is already on its way
+				new_grounds = []
+
+				for i, r in enumerate(self.team_index[team].get('ground') or []):
+
+					pos = (team_pos[team], i)
+
+					if r['venue_id'] not in first_ground:
+						new_grounds.append(r)
+
+					# teams come in as their pages download, so the first team playing there is only known by position
+					with settle_lock:
+						if (r['venue_id'] not in first_ground) or (pos < first_ground[r['venue_id']][0]):
+							first_ground[r['venue_id']] = (pos, team, r)
+							heapq.heappush(waiting, (pos, r['venue_id']))
+
+				grounds_left[team] = len(new_grounds)
+
+				for r in new_grounds:
+					emit('grounds', (team, r))
+
+				if not new_grounds:
+					self._stage_done(team, 'get_team_venues')
+
+				settle(emit, team)
+
+		def venue_page(item, emit):
 
-					elif k == 'nickname':
-						this_team_info[k] = [nick for nick in list({lg.lower().split('[')[0].split('(')[0].strip() 
-												for lg in re.split(r'[\n;,]\s*', td.text)}) if len(nick) > 1]
-					elif k == 'colours':
-						this_team_info[k] = list(set([l.lower().strip() for l in re.split(r'[\n;,  ]\s*', td.text) if 
-													(':' not in l) and l.strip() not in {'and', '&', ''}]))
-					elif k == 'founded':
-						if self.RE_YEAR.search(td.text):  # avoid empty search results
-							this_team_info[k] = min(self.RE_YEAR.findall(td.text), key=lambda _: int(_))
-						else:
-							this_team_info[k] = None
-					elif k == 'website':
-						this_team_info[k] = row.find('a')["href"]  # grab url not text
-					elif k == 'known_as':
-						this_team_info[k] = [t[0] for t in zip([_.text.strip().lower() for _ in td.find_all('b')], 
-												[line.lower() for line in td.text.split('\n') if re.search(r'\d{4}', line)])
-													if 'present' not in t[1]]
+			team, r = item
 
-					elif k == 'ground':
+			with metrics.stage('get_team_venues'):
+				venue = self._extract_pages('_scrape_venues', [r['wiki_url']], 'infobox', parallel=False, 
+												labels=[{'venue': r['wiki_url']}])[0]
 
-						as_ = td.find_all('a', attrs={'title': True})
+			with settle_lock:
+				scraped[r['venue_id']] = venue
 
-						_ = []
+			settle(emit)
 
-						if len(as_) == 1:
-							_.append({'name': tn.normalise(as_[0].text.lower().strip()), 'wiki_url': 'https://en.wikipedia.org' + as_[0]['href']})
-						else:
-							for g in as_:
-								if ((set(g.text.replace(',',' ').lower().split()) & self.GROUND_SYNS) or 
-										(set(g['title'].replace(',',' ').replace('_',' ').lower().split()) & self.GROUND_SYNS)):
-									_.append({'name': tn.normalise(g.text.lower().strip()), 'wiki_url': 'https://en.wikipedia.org' + g['href']})
+			grounds_left[team] -= 1
 
-						if k in this_team_info:
-							venue_names_already_there = {v['name'] for v in this_team_info[k]}
-							[this_team_info[k].append(v) for v in _ if v["name"] not in venue_names_already_there]
-						else:
-							this_team_info[k] = _
-					
-				elif th.has_attr('colspan') and (k == 'website'):
-					this_team_info[k] = row.next_sibling.next_sibling.find('a')['href']
-					continue
+			if not grounds_left[team]:
+				print(f'collecting venue info for {team.upper()}...ok')
+				self._stage_done(team, 'get_team_venues')
 
-		return this_team_info
+		def venue_record(item, emit):
 
-	def _scrape_team_sponsors(self, team_soup):
+			(_, team, r), venue = item
 
-		
-		def process_sponsors(sponsor_list, sponsor_now=False):
+			with metrics.stage('get_team_venues'), metrics.timer('team', stage='get_team_venues', team=team):
+				self._add_venue(self._venue_record(r, venue))
 
-			assert isinstance(sponsor_now, bool), 'incorrestly chosen option - only True or False allowed!'
+		def team_socials(team, emit):
 
-			if not sponsor_list:
-				return None
+			rec = self.team_index[team]
 
-			if not sponsor_now:
-				sponsors = {s.lower() for s in sponsor_list[:-1] if s != sponsor_list[-1]}
-				if not sponsors:
-					return None
-			else:
-				sponsors = [sponsor_list[-1]]
+			if rec.get('website'):
+				with metrics.stage('get_team_social_media'), metrics.timer('team', stage='get_team_social_media', team=team):
+					rec.update(self._scrape_socials(rec['website']))
 
-			# sponsors may be separates by new line or / or ,
-			sponsors = {z.strip() for s in sponsors 
-						for v in s.split('\n') 
-							for r in v.split('/') 
-								for z in r.split(',') if z.strip() and z.strip().isalnum()}	
+			self._stage_done(team, 'get_team_social_media')
 
-			return list(sponsors) if sponsors else None	
+		graph = StageGraph(queue_size)
 
+		graph.add('download_team', download(lambda team: self.team_urls[self.sport][team], 'team_pages', logos=colours), 'teams', 
+					['team_pages'], workers=fetch_workers)
+		graph.add('team_page', team_page, 'team_pages', (['parsed'] if venues else []) + (['socials'] if socials else []))
 
-		this_team_sponsors = defaultdict()
-		this_team_sponsors['sponsors'] = defaultdict()
-		
-		# sponsors are not always sitting in the same section so need to try a few scenarios
-		sp_span = team_soup.find('span', text=re.compile("Sponsorship"), attrs = {'id': 'Sponsorship'})
-	
-		if not sp_span:
-			sp_span = team_soup.find('span', text=re.compile("Sponsors"), attrs = {'id': 'Sponsors'})
-	
-		if not sp_span:
-			sp_span = team_soup.find('span', text="Colours and badge", attrs={'class': 'mw-headline'}) 
-		
-		# maybe there's no sponsor info, then just return an empty dict
-		if not sp_span:
-			return this_team_sponsors
+		if venues:
+			graph.add('team_grounds', team_grounds, 'parsed', ['grounds', 'settled'], batch=50)
+			graph.add('download_venue', download(lambda item: item[1]['wiki_url'], 'venue_pages'), 'grounds', ['venue_pages'], 
+						workers=fetch_workers)
+			graph.add('venue_page', venue_page, 'venue_pages', ['settled'])
+			graph.add('venue_record', venue_record, 'settled')
 
-		for sib in sp_span.parent.next_siblings:
-	
-			if sib.name == 'h2':
-				# apparently, no sponsor info, return empty dict
-				return this_team_sponsors
-	
-			if sib.name == 'table':
+		if socials:
+			graph.add('socials', team_socials, 'socials', workers=fetch_workers)
 
-				kit = []
-				shirt = []
-				other = []
-				
-				for i, row in enumerate(sib.find_all('tr')):
-					
-					if i == 0:    # skip header
-						continue
+		graph.run('teams', list(self.team_urls[self.sport]))
 
-					if (i == 1) and row.find('th'):
-						continue
+		return self
 
-					any_tds = row.find_all('td')
+class SQLiteStore:
+
+	'''
+	keeps teams and venues in normalised, indexed SQLite tables; records are bulk upserted in one 
+	transaction per call, so rebuilding a sport replaces its rows
+	'''
+
+	SCHEMA = """
+		CREATE TABLE IF NOT EXISTS teams (id INTEGER PRIMARY KEY, sport TEXT NOT NULL, name TEXT NOT NULL, wiki_url TEXT, 
+						location TEXT, website TEXT, league TEXT, record TEXT, UNIQUE (sport, name));
+		CREATE TABLE IF NOT EXISTS venues (id INTEGER PRIMARY KEY, wiki_url TEXT NOT NULL UNIQUE, name TEXT, state TEXT, 
+						location TEXT, capacity INTEGER, established TEXT, lat REAL, lng REAL, record TEXT);
+		CREATE TABLE IF NOT EXISTS grounds (team_id INTEGER NOT NULL REFERENCES teams(id) ON DELETE CASCADE, 
+						venue_url TEXT NOT NULL, name TEXT, PRIMARY KEY (team_id, venue_url));
+		CREATE TABLE IF NOT EXISTS sponsors (team_id INTEGER NOT NULL REFERENCES teams(id) ON DELETE CASCADE, 
+						period TEXT NOT NULL, kind TEXT NOT NULL, sponsor TEXT NOT NULL, PRIMARY KEY (team_id, period, kind, sponsor));
+		CREATE TABLE IF NOT EXISTS nicknames (team_id INTEGER NOT NULL REFERENCES teams(id) ON DELETE CASCADE, 
+						nickname TEXT NOT NULL, PRIMARY KEY (team_id, nickname));
+		CREATE TABLE IF NOT EXISTS teg_codes (venue_id INTEGER NOT NULL REFERENCES venues(id) ON DELETE CASCADE, 
+						teg_code TEXT NOT NULL, PRIMARY KEY (venue_id, teg_code));
+		CREATE INDEX IF NOT EXISTS teams_name ON teams (name);
+		CREATE INDEX IF NOT EXISTS teams_sport ON teams (sport);
+		CREATE INDEX IF NOT EXISTS venues_name ON venues (name);
+		CREATE INDEX IF NOT EXISTS venues_state ON venues (state);
+		CREATE INDEX IF NOT EXISTS grounds_venue_url ON grounds (venue_url);
+		CREATE INDEX IF NOT EXISTS nicknames_nickname ON nicknames (nickname);
+		CREATE INDEX IF NOT EXISTS teg_codes_teg_code ON teg_codes (teg_code);
+	"""
+
+	def __init__(self, db_path):
+
+		self.conn = sqlite3.connect(db_path)
+		self.conn.execute('PRAGMA foreign_keys = ON')
+		self.conn.execute('PRAGMA journal_mode = WAL')
+		self.conn.executescript(self.SCHEMA)
+
+	@staticmethod
+	def _number(v, to=float):
 
-					if any_tds:
+		try:
+			return to(v)
+		except (TypeError, ValueError):
+			return None
 
-						for j, td in enumerate(any_tds):
+	def write_teams(self, team_data):
 
-							if j == 0:
-								continue
+		with self.conn:
 
-							try:
-								rpl = int(td['rowspan'])
-							except:
-								rpl = 1
-							
-							# try to add to sponsor types, left to right
-							if len(kit) < i:
-								kit.extend([self.processors['sponsor'](td.text.lower())]*rpl)
-							elif len(shirt) < i:
-								shirt.extend([self.processors['sponsor'](td.text.lower())]*rpl)
-							elif len(other) < i:
-								other.extend([self.processors['sponsor'](td.text.lower())]*rpl)
-	
-				# verify that all sponsor types are the same length
-				if not len(kit) == len(shirt) == len(other):
-					print("some problem with sponsors!")
+			self.conn.executemany("""INSERT INTO teams (sport, name, wiki_url, location, website, league, record) VALUES (?, ?, ?, ?, ?, ?, ?)
+										ON CONFLICT (sport, name) DO UPDATE SET wiki_url = excluded.wiki_url, location = excluded.location, 
+											website = excluded.website, league = excluded.league, record = excluded.record""",
+									[(rec['sport'], rec['name'], rec.get('wiki_url'), rec.get('location'), rec.get('website'), 
+										json.dumps(rec.get('league')), json.dumps(rec)) for rec in team_data])
 
-				break
+			ids = {(sport, name): id_ for id_, sport, name in self.conn.execute('SELECT id, sport, name FROM teams')}
+			team_ids = [ids[(rec['sport'], rec['name'])] for rec in team_data]
 
+			# child rows are replaced wholesale
+			for table in ['grounds', 'sponsors', 'nicknames']:
+				self.conn.executemany(f'DELETE FROM {table} WHERE team_id = ?', [(id_,) for id_ in team_ids])
 
-		this_team_sponsors['sponsors']['previous'] = {'kit': process_sponsors(kit), 
-											'shirt': process_sponsors(shirt), 
-												'other': process_sponsors(other)}
-		this_team_sponsors['sponsors']['current'] = {'kit': process_sponsors(kit, sponsor_now=True), 
-											'shirt': process_sponsors(shirt, sponsor_now=True), 
-												'other': process_sponsors(other, sponsor_now=True)}
+			self.conn.executemany('INSERT OR IGNORE INTO grounds (team_id, venue_url, name) VALUES (?, ?, ?)', 
+									[(id_, r['wiki_url'], r.get('name')) for id_, rec in zip(team_ids, team_data) 
+										for r in (rec.get('ground') or [])])
 
-		return this_team_sponsors
+			self.conn.executemany('INSERT OR IGNORE INTO nicknames (team_id, nickname) VALUES (?, ?)', 
+									[(id_, nick) for id_, rec in zip(team_ids, team_data) for nick in (rec.get('nickname') or [])])
 
-	def _scrape_socials(self, team_website_url):
+			self.conn.executemany('INSERT OR IGNORE INTO sponsors (team_id, period, kind, sponsor) VALUES (?, ?, ?, ?)', 
+									[(id_, period, kind, sponsor) for id_, rec in zip(team_ids, team_data) 
+										for period, kinds in ((rec.get('sponsors') or {}).items()) 
+											for kind, sponsors in kinds.items() for sponsor in (sponsors or [])])
 
-		team_socials = defaultdict()
+		return self
 
-		soup = BeautifulSoup(requests.get(team_website_url).text, "lxml")
+	def write_venues(self, venue_data):
 
-		for a in soup.find('div', class_='social-links').find_all('a'):
-			for soc in self.socials_of_interest:
-				if soc in a['href']:
-					team_socials[soc] = a['href']
+		with self.conn:
 
+			self.conn.executemany("""INSERT INTO venues (wiki_url, name, state, location, capacity, established, lat, lng, record) 
+										VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+										ON CONFLICT (wiki_url) DO UPDATE SET name = excluded.name, state = excluded.state, 
+											location = excluded.location, capacity = excluded.capacity, established = excluded.established, 
+												lat = excluded.lat, lng = excluded.lng, record = excluded.record""",
+									[(v['wiki_url'], v.get('name'), v.get('state'), v.get('location'), self._number(v.get('capacity'), int), 
+										v.get('established'), self._number((v.get('coordinates') or {}).get('lat')), 
+											self._number((v.get('coordinates') or {}).get('lng')), json.dumps(v)) for v in venue_data])
 
-		return {'social_media_accounts': team_socials}
+			ids = {url: id_ for id_, url in self.conn.execute('SELECT id, wiki_url FROM venues')}
+			venue_ids = [ids[v['wiki_url']] for v in venue_data]
 
-	def _scrape_squad(self, team_soup):
+			self.conn.executemany('DELETE FROM teg_codes WHERE venue_id = ?', [(id_,) for id_ in venue_ids])
+			self.conn.executemany('INSERT OR IGNORE INTO teg_codes (venue_id, teg_code) VALUES (?, ?)', 
+									[(id_, code) for id_, v in zip(venue_ids, venue_data) for code in (v.get('teg_code') or [])])
 
-		fst_team_span = team_soup.find('span', id='First_team_squad')
-	
-		team_countries = []
-	
-		if not fst_team_span:
-			return team_countries
-		
-		for s in fst_team_span.parent.next_siblings:
-		
-			if s.name == 'table':
-		
-				# find the very first td
-				tr = s.find('tr')
-	
-				for flag in tr.find_all('span', class_="flagicon"):
-					team_countries.append(flag.find('a')["title"].lower())
-		
-				return {"player_citizenships": Counter(team_countries)}
+		return self
 
-		return team_countries
+	def close(self):
 
-	def _scrape_team_colors(self, team_soup):
+		self.conn.close()
 
-		def find_nearest_color(hex_color):
 
-			# make hex rgb
-			rgb_triplet = webcolors.hex_to_rgb(hex_color)
-	
-			min_colours = defaultdict() # {score: color name,..}
+def write_outputs(sport, team_data, venue_data, sqlite_path=None):
 
-			for key, name in webcolors.CSS3_HEX_TO_NAMES.items():
+	'''
+	write teaminfo-*/venueinfo-* json files and, if sqlite_path is given, the same records into a SQLite database
+	'''
 
-				r_c, g_c, b_c = webcolors.hex_to_rgb(key)
+	sp = sport.replace(' ','').upper()
 
-				rd = (r_c - rgb_triplet[0]) ** 2
-				gd = (g_c - rgb_triplet[1]) ** 2
-				bd = (b_c - rgb_triplet[2]) ** 2
+	_dump_json(team_data, 'teaminfo-' + sp + '.json')
+	_dump_json(venue_data, 'venueinfo-' + sp + '.json')
 
-				min_colours[rd + gd + bd] = name
+	if sqlite_path:
+		store = SQLiteStore(sqlite_path)
+		store.write_teams(team_data).write_venues(venue_data).close()
 
-			return(min_colours[min(min_colours.keys())])
+# stages a build runs, in order; the others are 'get_team_sponsors', 'get_int_profile', 'get_team_colors' and 'get_team_social_media'
+# {stage: SportDBCreator method,..} in the order stages run one after another
+STAGES = {'info': 'get_team_info', 'venues': 'get_team_venues', 'sponsors': 'get_team_sponsors', 
+			'squad': 'get_int_profile', 'colours': 'get_team_colors', 'socials': 'get_team_social_media'}
 
-		team_colors = defaultdict(lambda: defaultdict(list))
+# stages that need what other stages collect
+STAGE_NEEDS = {'venues': ['info'], 'socials': ['info']}
 
-		# background colors first (kit)
-		imgs = team_soup.find('td', attrs={'class': 'toccolours'})
-		
-		if imgs:
+def stage_methods(stages):
 
-			hexs = []
+	'''
+	SportDBCreator methods for comma separated stages (and the stages they need), in running order
+	'''
 
-			for ss in imgs.find_all('div', style=re.compile('background-color')):
+	wanted = {st.strip() for st in stages.split(',') if st.strip()}
 
-				colcode = ss["style"].split('background-color:')[-1].replace(';','').strip()
+	unknown = wanted - set(STAGES)
 
-				if len(colcode) == 7:
-					hexs.append(colcode)
+	if unknown:
+		raise Exception(f'unknown stage(s) {", ".join(sorted(unknown))}, choose from {", ".join(STAGES)}')
 
-			for t in Counter(hexs).most_common(5):
+	wanted |= {need for st in wanted for need in STAGE_NEEDS.get(st, [])}
 
-				try:
-					c = webcolors.hex_to_name(webcolors.normalize_hex(t[0]))
-				except:
-					c = find_nearest_color(t[0])
+	return [STAGES[st] for st in STAGES if st in wanted]
 
-				team_colors['kit']['hex'].append(t[0])
-				team_colors['kit']['name'].append(c)
+def source_from_args(args):
 
-			team_colors['kit']['name'] = list(set(team_colors['kit']['name']))
+	if args.dump:
+		return DumpSource(args.dump)
 
-		# team logos
+	fetcher = HTTPFetcher(rate=args.rate, burst=args.rate, pool_size=args.workers)
 
-		if not os.path.isdir('data_temp'):
-			os.mkdir('data_temp')
+	return APISource(args.api, fetcher) if getattr(args, 'api', None) else fetcher
 
-		im_logo = team_soup.find('a', class_='image')
-	
-		with open('data_temp/logofile.png', 'wb') as f:
-			f.write(requests.get('https:' + im_logo.find('img')['src']).content)
-	
-		i1 = cv2.imread('data_temp/logofile.png')
-	
-		rgbs = []
-	
-		for x in range(i1.shape[0]):
-			for y in range(i1.shape[1]):
+def creator_from_args(sport, args, teams=None, state_tag=''):
 
-				bgr = list(i1[x,y,:])
-				rgbs.append(tuple(bgr[::-1]))
+	return SportDBCreator(sport, pages=PageCache(cache_dir=args.cache_dir, ttl=args.cache_ttl*3600, 
+												fetcher=source_from_args(args),
+													max_workers=args.workers), 
+							colour_space=args.colour_space, logo_max_side=args.logo_max_side, 
+							partial_parsing=not args.full_parse, parse_workers=args.parse_workers, 
+							incremental=args.incremental, teams=teams, state_tag=state_tag, 
+							stages=args.stages, stream_dir=getattr(args, 'stream_dir', None))
 
-		for t in Counter(rgbs).most_common(5):
+def build(sc, norm_cache=None, pipeline=True, queue_size=16):
 
-			try:
-				c = webcolors.rgb_to_name(t[0])
-			except:
-				c = find_nearest_color(webcolors.rgb_to_hex(t[0]))
+	'''
+	run the stages of sc; in pipeline mode teams stream through them, otherwise each stage is done for all 
+	teams before the next one starts, which is also how incremental builds and builds with a parse pool run
+	'''
 
-			team_colors['logo']['hex'].append(webcolors.rgb_to_hex(t[0]))
-			team_colors['logo']['name'].append(c)
-		
-		shutil.rmtree('data_temp')
+	if norm_cache:
+		tn.load(norm_cache)
 
-		team_colors['logo']['name'] = list(set(team_colors['logo']['name']))
+	try:
+		if pipeline and sc.stages and (not sc.incremental) and (sc.parse_workers < 2):
+			sc.run_pipeline(fetch_workers=sc.pages.max_workers, queue_size=queue_size)
+		else:
+			for stage in (sc.stages or []):
+				with metrics.stage(stage):
+					getattr(sc, stage)()
+	finally:
+		sc.close()
 
-		return {"team_colors": team_colors}
+	metrics.dump_profile()
 
-	def _scrape_venues(self, venue_soup):
+	if sc.incremental:
+		sc.save_state()
 
-		venue_data = defaultdict()
-		
-		venue_infobox = venue_soup.find('table', class_='infobox')	
+	if norm_cache:
+		tn.save(norm_cache)
 
-		if not venue_infobox:
-			return venue_data	
+	st = tn.stats()
+	print(f'normalisation cache: {st["hits"]} hits, {st["misses"]} misses, {st["evictions"]} evictions ({st["hit_rate"]:.0%} hit rate)')
 
-		for row in venue_infobox.find_all("tr"):
-			
-			# try to find both 'th' and 'td' that should be in the same row
-			th = row.find('th')
-			td = row.find('td')
+	return sc
 
-			if th:  
+def write_metrics(json_path=None, prom_path=None, tag=''):
 
-				heading = th.text.lower()
+	'''
+	write the run report (json) and/or Prometheus metrics; tag goes before the file extension, e.g. for shards
+	'''
 
-				if ('establ' in heading) or ('opened' in heading) or ('founded' in heading):
-					k = 'established'
-				elif 'capacity' in heading:
-					k = 'capacity'
-				elif 'locat' in heading:
-					k = 'location'
-				elif 'coord' in heading:
-					k = 'coordinates'
-				elif 'own' in heading:
-					k = 'owner'
-				elif ('former' in heading) and ('name' in heading):
-					k = 'known_as'
-				else:
-					continue	
+	if json_path:
+		root, ext = os.path.splitext(json_path)
+		_dump_json(metrics.report(), root + tag + ext)
 
-				if td:  # 2-column scenario
-	
-					if k in ['location']:
-						venue_data[k] = td.text.replace("\n",' ').lower().strip().split('(')[0]
-					elif k == 'established':
-						venue_data[k] = self.RE_YEAR.search(td.text).group(0)
-					elif k == 'capacity':
-						venue_data[k] = re.search(r'\d+,*\d+', td.text).group(0).replace(',','')
-					elif k == 'coordinates':
-						_ = td.find('span', class_='geo-dec').parent.find('span', class_='geo').text.split(';')
-						venue_data[k] = {'lat': _[0].strip(), 'lng': _[1].strip()}
-					elif k == 'owner':
-						venue_data[k] = [v.lower().split('(')[0].strip() for v in re.split(r'[\n;,]\s*', td.text) if v.strip()]
-					elif k == 'known_as':
-						venue_data[k] = [v.lower().split('(')[0].strip() for v in re.split(r'[\n;,]\s*', td.text) if v.strip()]
-						# also try to find more former or alternative names in the first paragraph of main text where these would be in bold
-					else:
-						pass
+	if prom_path:
+		root, ext = os.path.splitext(prom_path)
+		with open(root + tag + ext, 'w') as f:
+			f.write(metrics.prometheus())
 
-		for s in venue_infobox.next_siblings:
-			if s.name == 'p':
-				for b in s.find_all('b'):
-					text_in_bold = b.text.lower().strip()
-					if 'known_as' not in venue_data:
-						if len(text_in_bold) > 1:
-							venue_data['known_as'] = [text_in_bold]
-					else:
-						if ((len(text_in_bold) > 1) and 
-								(text_in_bold not in venue_data['known_as'])):
-							venue_data['known_as'].append(text_in_bold)
-				break  # consider only the very first paragraph
+def _dump_json(obj, path):
 
+	# a merge never picks up a half-written shard
+	_atomic_write(path, json.dumps(obj), 'w')
 
-		return venue_data
+def shard_of(sport, team, n_shards):
 
-	def get_team_info(self):
+	'''
+	shard number for a team; stable across machines and runs and mostly unaffected by adding teams
+	'''
 
-		
-		for team in self.team_urls[self.sport]:
-			print(f'collecting basic team info for {team.upper()}...', end='')
-			for rec in self.team_data:
-				if rec['name'] == team:
-					rec.update(self._scrape_team_infobox(BeautifulSoup(requests.get(self.team_urls[self.sport][team]).text, 'html.parser')))
-					break
-			print('ok')
+	return zlib.crc32(f'{sport}/{team}'.encode()) % n_shards
 
-		return self
+def _shard_path(shard_dir, shard, n_shards, sport):
 
-	def get_team_venues(self):
+	return os.path.join(shard_dir, f'shard-{shard}-of-{n_shards}-' + sport.replace(' ','').upper() + '.json')
 
-		for team in self.team_urls[self.sport]:
-			print(f'collecting venue info for {team.upper()}...', end='')
-			for rec in self.team_data:
-				if rec['name'] == team:
-					if 'ground' in rec and rec['ground']:
-						for r in rec['ground']:
-							venue_record = {**r, **self._scrape_venues(BeautifulSoup(requests.get(r['wiki_url']).text, 'html.parser'))}
-							# update with TEG codes and states
-							venue_record.update(tcf.find_teg_code(venue_record))
-							self.venue_data.append(venue_record)
-						
+def build_shard(shard, n_shards, sports, args):
 
-			print('ok')
+	'''
+	build all teams (of all sports) that fall into shard and write partial outputs to args.shard_dir; 
+	shards can run in separate processes or on separate machines sharing a filesystem
+	'''
 
-		return self
+	global tcf
 
-	def get_team_sponsors(self):
+	if 'tcf' not in globals():
+		tcf = TEGCodeFinder(args.suburbs, args.teg_venues)
 
-		print('collecting team sponsors...', end='')
+	team_urls = json.load(open('data/team-wiki-urls.json', 'r'))
 
-		for team in self.team_urls[self.sport]:
+	for sport in sports:
 
-			for rec in self.team_data:
-				if rec['name'] == team:
-					rec.update(self._scrape_team_sponsors(BeautifulSoup(requests.get(self.team_urls[self.sport][team]).text, 'html.parser')))
-					break
+		teams = [t for t in team_urls[sport] if shard_of(sport, t, n_shards) == shard]
 
-		print('ok')
+		team_data, venue_data = [], []
 
-		return self
+		if teams:
+			sc = build(creator_from_args(sport, args, teams=teams, state_tag=f'.shard-{shard}-of-{n_shards}'), 
+							getattr(args, 'norm_cache', None), pipeline=not args.no_pipeline, queue_size=args.queue_size)
+			team_data, venue_data = sc.team_data, sc.venue_data
 
-	def get_int_profile(self):
+		_dump_json({'sport': sport, 'shard': shard, 'team_data': team_data, 'venue_data': venue_data}, 
+						_shard_path(args.shard_dir, shard, n_shards, sport))
 
-		print('collecting player citizenships...', end='')
+	write_metrics(getattr(args, 'metrics', None), getattr(args, 'metrics_prom', None), tag=f'.shard-{shard}-of-{n_shards}')
 
-		for team in self.team_urls[self.sport]:
+	return shard
 
-			for rec in self.team_data:
-				if rec['name'] == team:
-					rec.update(self._scrape_squad(BeautifulSoup(requests.get(self.team_urls[self.sport][team]).text, 'html.parser')))
-					break
+def merge_shards(n_shards, sports, shard_dir, sqlite_path=None):
 
-		print('ok')
+	'''
+	combine shard outputs into teaminfo-*/venueinfo-* files: teams come in the order of data/team-wiki-urls.json 
+	and each venue is listed once, as first referenced by a team
+	'''
 
-		return self
+	team_urls = json.load(open('data/team-wiki-urls.json', 'r'))
 
-	def get_team_colors(self):
+	for sport in sports:
 
-		print('collecting team colors...', end='')
+		parts = []
 
-		for team in self.team_urls[self.sport]:
+		for shard in range(n_shards):
+			try:
+				parts.append(json.load(open(_shard_path(shard_dir, shard, n_shards, sport), 'r')))
+			except OSError:
+				raise Exception(f'shard {shard} of {n_shards} for {sport} is missing, can\'t merge!')
 
-			for rec in self.team_data:
-				if rec['name'] == team:
-					rec.update(self._scrape_team_colors(BeautifulSoup(requests.get(self.team_urls[self.sport][team]).text, 'html.parser')))
-					break
+		teams_by_name = {rec['name']: rec for part in parts for rec in part['team_data']}
+		team_data = [teams_by_name[t] for t in team_urls[sport] if t in teams_by_name]
 
-		print('ok')
+		# a venue shared by teams in different shards is in each of them
+		venues_by_id = defaultdict(list)
 
-		return self
+		for part in parts:
+			for v in part['venue_data']:
+				venues_by_id[v['venue_id']].append(v)
 
+		venue_data = []
+		seen = set()
 
-	def get_team_social_media(self):
+		for rec in team_data:
+			for r in (rec.get('ground') or []):
+				if (r.get('venue_id') in venues_by_id) and (r['venue_id'] not in seen):
+					seen.add(r['venue_id'])
+					same_name = [v for v in venues_by_id[r['venue_id']] if v['name'] == r['name']]
+					venue_data.append(same_name[0] if same_name else venues_by_id[r['venue_id']][0])
 
-		print('collecting team social media account info...', end='')
+		write_outputs(sport, team_data, venue_data, sqlite_path)
 
-		for team in self.team_urls[self.sport]:
+		sp = sport.replace(' ','').upper()
 
-			for rec in self.team_data:
-				if rec['name'] == team and rec['website']:
-					rec.update(self._scrape_socials(rec['website']))
-					break
+		# incremental shard builds also leave deltas; only those of the shards being merged count
+		delta_paths = [f'delta-{sp}.shard-{shard}-of-{n_shards}.json' for shard in range(n_shards)]
+		shard_deltas = [json.load(open(f, 'r')) for f in delta_paths if os.path.exists(f)]
 
-		print('ok')
+		if shard_deltas:
+			_dump_json({kind: {ch: sorted({k for d in shard_deltas for k in d[kind][ch]}) for ch in ['added', 'changed', 'removed']} 
+							for kind in ['teams', 'venues']}, 'delta-' + sp + '.json')
 
-		return self
+		print(f'merged {n_shards} shards for {sport}: {len(team_data)} teams, {len(venue_data)} venues')
 
-if __name__ == '__main__':
+def run_shards(n_shards, sports, args):
 
-	tcf = TEGCodeFinder()
+	'''
+	build all shards on a local process pool, then merge
+	'''
 
-	sc = (SportDBCreator()
-			.get_team_info().get_team_venues())
-				# .get_team_sponsors()
-				# 	.get_int_profile()
-				# 		.get_team_colors()
-				# 			.get_team_social_media())
+	ctx = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else None
+
+	with ProcessPoolExecutor(max_workers=n_shards, mp_context=ctx) as ex:
+		for shard in ex.map(build_shard, range(n_shards), [n_shards]*n_shards, [sports]*n_shards, [args]*n_shards):
+			print(f'shard {shard} of {n_shards} done')
+
+	merge_shards(n_shards, sports, args.shard_dir, args.sqlite)
+
+if __name__ == '__main__':
 
-	json.dump(sc.team_data, open('teaminfo-' + sc.sport.replace(' ','').upper() + '.json', 'w'))
-	json.dump(sc.venue_data, open('venueinfo-' + sc.sport.replace(' ','').upper() + '.json', 'w'))
\ No newline at end of file
+	parser = argparse.ArgumentParser(description='create a database containing basic info about australian sport teams')
+	parser.add_argument('sport', help='sport as in data/team-wiki-urls.json or all')
+	parser.add_argument('--stages', default='info,venues', help='comma separated stages to run, any of ' + ','.join(STAGES))
+	parser.add_argument('--no-pipeline', action='store_true', help='do each stage for all teams before starting the next one')
+	parser.add_argument('--queue-size', type=int, default=16, help='max items waiting between two pipeline stages')
+	parser.add_argument('--cache-dir', default='data_cache/pages', help='where to keep downloaded pages')
+	parser.add_argument('--cache-ttl', type=float, default=24, help='hours before a cached page is revalidated')
+	parser.add_argument('--workers', type=int, default=8, help='concurrent downloads')
+	parser.add_argument('--rate', type=float, default=5, help='max requests per second to each host')
+	parser.add_argument('--colour-space', choices=['rgb', 'lab'], default='rgb', help='space to find nearest colour names in')
+	parser.add_argument('--dump', help='build offline from this local wikipedia HTML dump (bz2 multistream ndjson)')
+	parser.add_argument('--api', metavar='API_URL', help='get pages through this MediaWiki Action API, e.g. https://en.wikipedia.org/w/api.php')
+	parser.add_argument('--incremental', action='store_true', help='only re-extract pages that changed since the last run')
+	parser.add_argument('--parse-workers', type=int, default=1, help='processes to parse and scrape pages on')
+	parser.add_argument('--full-parse', action='store_true', help='parse whole pages rather than only the regions scrapers read')
+	parser.add_argument('--logo-max-side', type=int, default=None, help='downscale logos to at most this many pixels on the longer side')
+	parser.add_argument('--sqlite', help='also write teams and venues into this SQLite database')
+	parser.add_argument('--shards', type=int, help='split the build into this many shards, run them on local processes and merge')
+	parser.add_argument('--shard', help='only build shard I/N, e.g. 3/8, for builds spread over machines sharing a filesystem')
+	parser.add_argument('--merge', type=int, metavar='N', help='only merge N shards built before')
+	parser.add_argument('--shard-dir', default='data_cache/shards', help='where shards write their partial outputs')
+	parser.add_argument('--suburbs', default='/Users/ik/Data/suburbs-and-postcodes/aus_suburbs_auspost_APR2017.json', help='AusPost suburbs json')
+	parser.add_argument('--teg-venues', default='../temp_venue_match/teg_venues_anz.json', help='TEG venues json')
+	parser.add_argument('--norm-cache', help='keep normalised strings in this file between runs')
+	parser.add_argument('--metrics', help='write a json run report with timings, http requests and cache hit rates here')
+	parser.add_argument('--metrics-prom', help='write the same metrics in Prometheus text format here')
+	parser.add_argument('--profile-stage', help='run this stage under cProfile')
+	parser.add_argument('--stream-dir', help='append each finished team and venue record to jsonl files in this directory instead')
+	args = parser.parse_args()
+
+	if args.rate <= 0:
+		parser.error('--rate has to be greater than 0')
+
+	if args.stream_dir and (args.shards or args.shard or args.merge or (args.sport == 'all')):
+		parser.error('--stream-dir only works for single sport, unsharded builds')
+
+	if args.stream_dir and args.sqlite:
+		parser.error('--stream-dir doesn\'t keep records to write into --sqlite, use one or the other')
+
+	sports = list(json.load(open('data/team-wiki-urls.json', 'r'))) if args.sport == 'all' else [args.sport]
+
+	try:
+		args.stages = stage_methods(args.stages)
+	except Exception as e:
+		parser.error(str(e))
+
+	metrics.profile_stage = STAGES.get(args.profile_stage, args.profile_stage)
+
+	if args.merge:
+		merge_shards(args.merge, sports, args.shard_dir, args.sqlite)
+	elif args.shard:
+		shard, n_shards = map(int, args.shard.split('/'))
+		build_shard(shard, n_shards, sports, args)
+	elif args.shards or (len(sports) > 1):
+		tcf = TEGCodeFinder(args.suburbs, args.teg_venues)
+		run_shards(args.shards or 1, sports, args)
+	else:
+		tcf = TEGCodeFinder(args.suburbs, args.teg_venues)
+
+		sc = build(creator_from_args(args.sport, args), args.norm_cache, pipeline=not args.no_pipeline, queue_size=args.queue_size)
+
+		# streamed records are already on disk
+		if not args.stream_dir:
+			write_outputs(sc.sport, sc.team_data, sc.venue_data, args.sqlite)
+
+		# sharded builds write metrics per shard
+		write_metrics(args.metrics, args.metrics_prom)
@@ -0,0 +1,322 @@
+'''
+a stand-in for the MediaWiki Action API serving recorded pages, so that the API source of austeams-db.py
+(--api) can be run and tested offline. it answers the queries austeams-db.py makes: action=query for titles,
+redirects, revision ids, page props and coordinates (up to 50 titles at a time, like the real API) and
+action=parse for page content. with --upstream, whatever isn't recorded is asked for there and recorded
+'''
+
+import json
+import os
+import sys
+import tempfile
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qsl, quote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+import lxml.html
+
+MAX_TITLES = 50
+
+
+def normalise(title):
+
+	# what mediawiki does to titles before looking them up
+	title = ' '.join(title.replace('_', ' ').split())
+
+	return title[:1].upper() + title[1:]
+
+
+class Recordings:
+
+	'''
+	recorded pages in a json file, {"redirects": {title: target title,..}, "pages": {title: {"pageid": .., "revid": ..,
+	"pageprops": {..}, "coordinates": [{"lat": .., "lon": ..}], "file": html file relative to the json file},..}}.
+	a file can be a whole rendered page, in which case only its parser output is served
+	'''
+
+	def __init__(self, path):
+
+		self.path = path
+		self.dir = os.path.dirname(os.path.abspath(path))
+		self._lock = threading.Lock()
+
+		try:
+			saved = json.load(open(path, 'r'))
+		except OSError:
+			saved = {}
+
+		self.redirects = saved.get('redirects', {})
+		self.pages = saved.get('pages', {})
+
+	def resolve(self, title):
+
+		'''
+		returns (normalised title, redirect target or None)
+		'''
+
+		title = normalise(title)
+
+		return (title, self.redirects.get(title))
+
+	def known(self, title):
+
+		title, target = self.resolve(title)
+
+		return (target or title) in self.pages
+
+	def html(self, title):
+
+		html = open(os.path.join(self.dir, self.pages[title]['file']), 'r', encoding='utf-8').read()
+
+		if '<html' not in html[:1000]:
+			return html
+
+		output = lxml.html.document_fromstring(html).find_class('mw-parser-output')
+
+		return lxml.html.tostring(output[0], encoding='unicode') if output else html
+
+	def add_page(self, title, html=None, **meta):
+
+		with self._lock:
+
+			page = self.pages.setdefault(title, {})
+			page.update({k: v for k, v in meta.items() if v is not None})
+
+			if html is not None:
+				page['file'] = page.get('file') or os.path.join('pages', quote(title.replace(' ', '_'), safe='') + '.html')
+				path = os.path.join(self.dir, page['file'])
+				if not os.path.isdir(os.path.dirname(path)):
+					os.makedirs(os.path.dirname(path))
+				open(path, 'w', encoding='utf-8').write(html)
+
+	def add_redirect(self, title, target):
+
+		title, target = normalise(title), normalise(target)
+
+		with self._lock:
+			if title != target:
+				self.redirects[title] = target
+
+	def save(self):
+
+		with self._lock:
+
+			fd, tmp_path = tempfile.mkstemp(dir=self.dir)
+
+			try:
+				with os.fdopen(fd, 'w') as f:
+					json.dump({'redirects': self.redirects, 'pages': self.pages}, f, indent=1, sort_keys=True)
+				os.replace(tmp_path, self.path)
+			except BaseException:
+				try:
+					os.remove(tmp_path)
+				except OSError:
+					pass
+				raise
+
+
+class StandIn:
+
+	'''
+	answers API requests (as dicts of query parameters) from recordings, or from upstream for what isn't recorded
+	'''
+
+	def __init__(self, recordings, upstream=None):
+
+		self.recordings = recordings
+		self.upstream = upstream
+
+		self.requests = 0
+		self._lock = threading.Lock()
+
+	@staticmethod
+	def error(code, info):
+
+		return {'error': {'code': code, 'info': info}}
+
+	def query(self, params):
+
+		titles = [t for t in params.get('titles', '').split('|') if t]
+		props = set(params.get('prop', '').split('|'))
+
+		if len(titles) > MAX_TITLES:
+			return self.error('toomanyvalues', f'Too many values supplied for parameter "titles". The limit is {MAX_TITLES}.')
+
+		if self.upstream and any(not self.recordings.known(t) for t in titles):
+			self.record_query(params)
+
+		normalized, redirects, pages = [], [], {}
+
+		for t in titles:
+
+			title, target = self.recordings.resolve(t)
+
+			if title != t:
+				normalized.append({'fromencoded': False, 'from': t, 'to': title})
+
+			if target and params.get('redirects'):
+				redirects.append({'from': title, 'to': target})
+				title = target
+
+			if title in pages:
+				continue
+
+			rec = self.recordings.pages.get(title)
+
+			if not rec:
+				pages[title] = {'ns': 0, 'title': title, 'missing': True}
+				continue
+
+			page = {'pageid': rec.get('pageid'), 'ns': 0, 'title': title}
+
+			if 'revisions' in props:
+				page['revisions'] = [{'revid': rec.get('revid'), 'parentid': rec.get('parentid', 0)}]
+			if ('pageprops' in props) and rec.get('pageprops'):
+				page['pageprops'] = rec['pageprops']
+			if ('coordinates' in props) and rec.get('coordinates'):
+				page['coordinates'] = [{'primary': True, 'globe': 'earth', **c} for c in rec['coordinates']]
+
+			pages[title] = page
+
+		q = {'pages': list(pages.values())}
+
+		if normalized:
+			q['normalized'] = normalized
+		if redirects:
+			q['redirects'] = redirects
+
+		return {'batchcomplete': True, 'query': q}
+
+	def parse(self, params, record=True):
+
+		title, target = self.recordings.resolve(params.get('page', ''))
+		redirects = []
+
+		if target and params.get('redirects'):
+			redirects.append({'from': title, 'to': target})
+			title = target
+
+		if 'file' not in self.recordings.pages.get(title, {}):
+
+			if self.upstream and record:
+				self.record_parse(params)
+				return self.parse(params, record=False)
+
+			return self.error('missingtitle', 'The page you specified doesn\'t exist.')
+
+		rec = self.recordings.pages[title]
+
+		return {'parse': {'title': title, 'pageid': rec.get('pageid'), 'revid': rec.get('revid'), 'redirects': redirects,
+							'text': self.recordings.html(title)}}
+
+	def _upstream(self, params):
+
+		return requests.get(self.upstream, params={**params, 'format': 'json', 'formatversion': 2}, timeout=(5, 30),
+								headers={'User-Agent': 'austeams-db stand-in (https://github.com/eeghor/austeams-db)'}).json()
+
+	def record_query(self, params):
+
+		q = self._upstream({'action': 'query', 'titles': params['titles'], 'redirects': 1, 'prop': 'revisions|pageprops|coordinates',
+								'rvprop': 'ids', 'colimit': 'max'}).get('query', {})
+
+		for r in q.get('normalized', []) + q.get('redirects', []):
+			self.recordings.add_redirect(r['from'], r['to'])
+
+		for p in q.get('pages', []):
+			if not p.get('missing'):
+				self.recordings.add_page(p['title'], pageid=p.get('pageid'), revid=(p.get('revisions') or [{}])[0].get('revid'),
+											pageprops=p.get('pageprops'),
+												coordinates=[{'lat': c['lat'], 'lon': c['lon']} for c in p.get('coordinates', [])] or None)
+
+		self.recordings.save()
+
+	def record_parse(self, params):
+
+		p = self._upstream({'action': 'parse', 'page': params.get('page', ''), 'prop': 'text|revid', 'redirects': 1,
+								'disableeditsection': 1, 'disablelimitreport': 1}).get('parse')
+
+		if p:
+
+			for r in p.get('redirects', []):
+				self.recordings.add_redirect(r['from'], r['to'])
+
+			self.recordings.add_redirect(params.get('page', ''), p['title'])
+			self.recordings.add_page(p['title'], html=p['text'], pageid=p.get('pageid'), revid=p.get('revid'))
+			self.recordings.save()
+
+	def answer(self, params):
+
+		with self._lock:
+			self.requests += 1
+
+		if params.get('action') == 'query':
+			return self.query(params)
+		if params.get('action') == 'parse':
+			return self.parse(params)
+
+		return self.error('badvalue', f'Unrecognized value for parameter "action": {params.get("action")}.')
+
+
+def serve(recordings_path, host='127.0.0.1', port=0, upstream=None, verbose=False):
+
+	'''
+	starts the stand-in on a background thread and returns the server; its API url is server.api_url and
+	server.stand_in.requests counts the requests it has answered
+	'''
+
+	stand_in = StandIn(Recordings(recordings_path), upstream)
+
+	class Handler(BaseHTTPRequestHandler):
+
+		def do_GET(self):
+
+			u = urlparse(self.path)
+
+			if u.path != '/w/api.php':
+				self.send_error(404)
+				return
+
+			body = json.dumps(stand_in.answer(dict(parse_qsl(u.query)))).encode()
+
+			self.send_response(200)
+			self.send_header('Content-Type', 'application/json; charset=utf-8')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+
+			if verbose:
+				super().log_message(format, *args)
+
+	server = ThreadingHTTPServer((host, port), Handler)
+	server.daemon_threads = True
+	server.stand_in = stand_in
+	server.api_url = f'http://{host}:{server.server_port}/w/api.php'
+
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+
+	return server
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='serve recorded MediaWiki API responses, e.g. for austeams-db.py --api')
+	parser.add_argument('--recordings', default='data/fixtures/api.json', help='recorded pages, see Recordings')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8089)
+	parser.add_argument('--upstream', help='record what isn\'t recorded yet from this API, e.g. https://en.wikipedia.org/w/api.php')
+	parser.add_argument('--verbose', action='store_true', help='log every request')
+	args = parser.parse_args()
+
+	server = serve(args.recordings, args.host, args.port, args.upstream, args.verbose)
+
+	print(f'serving {len(server.stand_in.recordings.pages)} recorded pages at {server.api_url}')
+
+	try:
+		threading.Event().wait()
+	except KeyboardInterrupt:
+		print(f'\nanswered {server.stand_in.requests} requests')
+		sys.exit()
@@ -0,0 +1,502 @@
+import json
+import os
+import io
+import sys
+import time
+import timeit
+import random
+import fnmatch
+import tempfile
+import platform
+import argparse
+import statistics
+import subprocess
+import contextlib
+import importlib.util
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_script(name, file_name):
+
+	'''
+	the scripts have dashes in their names so they can't simply be imported
+	'''
+
+	spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, file_name))
+	module = importlib.util.module_from_spec(spec)
+	sys.modules[name] = module
+	spec.loader.exec_module(module)
+
+	return module
+
+adb = load_script('austeams_db', 'austeams-db.py')
+
+
+class FixtureSource:
+
+	'''
+	serves the pages and logos recorded in a fixture directory instead of downloading them; anything
+	not recorded is a 404, so a benchmark can never touch the network
+	'''
+
+	remote = False
+
+	def __init__(self, fixture_dir='data/fixtures'):
+
+		self.manifest = json.load(open(os.path.join(fixture_dir, 'fixtures.json'), 'r'))
+		self.content = {url: open(os.path.join(fixture_dir, path), 'rb').read() for url, path in self.manifest['pages'].items()}
+
+	def fetch(self, url, headers=None):
+
+		if url in self.content:
+			return adb.DumpResponse(200, self.content[url])
+
+		return adb.DumpResponse(404)
+
+
+# the recorded wikipedia pages as a local HTML dump, see write_fixture_dump
+FIXTURE_DUMP = 'pages-dump.ndjson.bz2'
+
+def write_fixture_dump(fixture_dir='data/fixtures'):
+
+	'''
+	writes the wikipedia pages recorded in fixture_dir into a dump DumpSource can read, one record per page 
+	under the title it's linked to, so that a build from the dump sees what one from the FixtureSource sees
+	'''
+
+	source = FixtureSource(fixture_dir)
+
+	adb.DumpSource.write(os.path.join(fixture_dir, FIXTURE_DUMP), 
+							({'name': adb.wiki_title(url), 'article_body': {'html': content.decode('utf-8')}, 'redirects': []} 
+								for url, content in source.content.items() if '/wiki/' in url), pages_per_stream=4)
+
+def synthetic_reference(n_suburbs=15000, n_teg_venues=20000, seed=0):
+
+	'''
+	made up AusPost suburbs and TEG venues shaped like the real files, plus the suburbs and venues
+	that appear in the fixtures so that lookups on those succeed
+	'''
+
+	rnd = random.Random(seed)
+
+	states = ['nsw', 'vic', 'qld', 'wa', 'sa', 'tas', 'act', 'nt']
+	syllables = 'ba bel ca cor dan el fern gar hill kin la mar nor oak pen ros sun tor val war wood yar'.split()
+	venue_types = ['stadium', 'oval', 'park', 'arena', 'sports centre', 'showgrounds', 'reserve', 'recreation ground']
+
+	def word():
+		return ''.join(rnd.choice(syllables) for _ in range(rnd.randint(2, 3)))
+
+	suburbs = [(' '.join(word() for _ in range(rnd.choice([1, 1, 1, 2, 2, 3]))), rnd.choice(states)) for _ in range(n_suburbs)]
+	suburbs += [('moore park', 'nsw'), ('lilyfield', 'nsw'), ('sydney', 'nsw'), ('geelong', 'vic'), ('yarra park', 'vic'),
+					('melbourne', 'vic'), ('st kilda', 'vic'), ('perth', 'wa'), ('bruce', 'act'), ('canberra', 'act')]
+
+	aus_suburbs = defaultdict(list)
+
+	for name, state in suburbs:
+		aus_suburbs[name[0]].append({'name': name, 'state': state, 'postcode': str(rnd.randint(800, 7999)).zfill(4)})
+
+	teg_venues = [{'name': f'{rnd.choice(suburbs)[0]} {rnd.choice(venue_types)}', 'state': rnd.choice(states).upper(),
+					'teg_code': f'V{i:06d}'} for i in range(n_teg_venues)]
+	teg_venues += [{'name': name, 'state': state, 'teg_code': f'F{i:06d}'} for i, (name, state) in
+					enumerate([('Allianz Stadium', 'NSW'), ('Sydney Football Stadium', 'NSW'), ('Leichhardt Oval', 'NSW'),
+								('GMHBA Stadium', 'VIC'), ('Melbourne Cricket Ground', 'VIC'), ('MCG', 'VIC'), ('RAC Arena', 'WA'),
+									('AAMI Park', 'VIC'), ('GIO Stadium', 'ACT'), ('Canberra Stadium', 'ACT'), ('Junction Oval', 'VIC')])]
+
+	return (dict(aus_suburbs), teg_venues, [name for name, _ in suburbs])
+
+
+class Suite:
+
+	'''
+	everything the benchmarks run on: a SportDBCreator per sport reading from the fixtures, the parsed fixture
+	pages and a TEGCodeFinder on synthetic reference data
+	'''
+
+	def __init__(self, fixture_dir='data/fixtures', seed=0):
+
+		self.fixture_dir = fixture_dir
+		self.source = FixtureSource(fixture_dir)
+		self.manifest = self.source.manifest
+		self.pages = adb.PageCache(cache_dir=tempfile.mkdtemp(prefix='bench-pages-'), fetcher=self.source)
+
+		# SportDBCreator talks a lot
+		with contextlib.redirect_stdout(io.StringIO()):
+			self.creators = {sport: adb.SportDBCreator(sport, pages=self.pages) for sport in self.manifest['teams']}
+
+		self.team_pages = [(self.creators[sport], url) for sport, urls in self.manifest['teams'].items() for url in urls]
+		self.venue_pages = self.manifest['venues']
+
+		self.seed = seed
+		self.aus_suburbs, self.teg_venues, self.suburb_names = synthetic_reference(seed=seed)
+		self._tcf = None
+
+	@property
+	def tcf(self):
+
+		if self._tcf is None:
+			self._tcf = adb.TEGCodeFinder.from_data(self.aus_suburbs, self.teg_venues)
+
+		return self._tcf
+
+	def soups(self, region):
+
+		# the same soups a build would scrape (partial parsing is the default)
+		return [(sc, sc._soup(url, region)) for sc, url in self.team_pages]
+
+	def build(self, source, stages=('info', 'venues', 'sponsors', 'squad')):
+
+		'''
+		team and venue records of the fixture teams of every sport, built with pages from source
+		'''
+
+		adb.tcf = self.tcf
+		pages = adb.PageCache(cache_dir=tempfile.mkdtemp(prefix='bench-pages-'), fetcher=source)
+		built = {}
+
+		with contextlib.redirect_stdout(io.StringIO()):
+			for sport, urls in self.manifest['teams'].items():
+				teams = [t for t, url in self.creators[sport].team_urls[sport].items() if url in urls]
+				sc = adb.build(adb.SportDBCreator(sport, pages=pages, teams=teams, stages=adb.stage_methods(','.join(stages))))
+				built[sport] = json.loads(json.dumps({'teams': sc.team_data, 'venues': sc.venue_data}))
+
+		return built
+
+	def venue_records(self):
+
+		sc = next(iter(self.creators.values()))
+
+		return [{'name': adb.tn.normalise(adb.wiki_title(url).lower()), 'wiki_url': url,
+					**sc._scrape_venues(sc._soup(url, 'infobox'))} for url in self.venue_pages]
+
+
+# {benchmark name: function taking a Suite and returning (items processed per call, function to time) and,
+# for benchmarks holding on to something like a server, a function to call when done}
+BENCHMARKS = {}
+
+def benchmark(name):
+
+	def register(setup):
+		BENCHMARKS[name] = setup
+		return setup
+
+	return register
+
+@benchmark('parse.team_pages.full')
+def _(suite):
+
+	htmls = [suite.pages.get_html(url) for _, url in suite.team_pages]
+
+	return (len(htmls), lambda: [adb.bs4.BeautifulSoup(html, 'html.parser') for html in htmls])
+
+@benchmark('parse.team_pages.regions')
+def _(suite):
+
+	htmls = [suite.pages.get_html(url) for _, url in suite.team_pages]
+
+	def run():
+		for html in htmls:
+			tree = adb.lxml_html.document_fromstring(html)
+			regions = adb.page_regions(tree)
+			for region in adb.PAGE_REGIONS:
+				adb.bs4.BeautifulSoup(adb.region_html(tree, region, regions), 'lxml')
+
+	return (len(htmls), run)
+
+@benchmark('parse.team_pages.combined')
+def _(suite):
+
+	htmls = [suite.pages.get_html(url) for _, url in suite.team_pages]
+
+	# what the pipeline does: one soup with the regions of all team page stages
+	return (len(htmls), lambda: [adb.bs4.BeautifulSoup(adb.region_html(html, adb.PAGE_REGIONS), 'lxml') for html in htmls])
+
+@benchmark('scrape.team_infobox')
+def _(suite):
+
+	soups = suite.soups('infobox')
+
+	return (len(soups), lambda: [sc._scrape_team_infobox(soup) for sc, soup in soups])
+
+@benchmark('scrape.team_sponsors')
+def _(suite):
+
+	soups = suite.soups('sponsors')
+
+	return (len(soups), lambda: [sc._scrape_team_sponsors(soup) for sc, soup in soups])
+
+@benchmark('scrape.squad')
+def _(suite):
+
+	soups = suite.soups('squad')
+
+	return (len(soups), lambda: [sc._scrape_squad(soup) for sc, soup in soups])
+
+@benchmark('scrape.team_colors')
+def _(suite):
+
+	soups = suite.soups('colours')
+
+	def run():
+		for sc, soup in soups:
+			# time the logo decoding too, not just the lookup of the colours found last time
+			sc.logo_colours.clear()
+			sc._scrape_team_colors(soup)
+
+	return (len(soups), run)
+
+@benchmark('scrape.team_page')
+def _(suite):
+
+	soups = [(sc, sc._soup(url, adb.PAGE_REGIONS)) for sc, url in suite.team_pages]
+
+	for sc, _ in soups:
+		sc.stages = list(sc.TEAM_PAGE_STAGES)
+
+	def run():
+		for sc, soup in soups:
+			sc.logo_colours.clear()
+			sc._scrape_team_page(soup)
+
+	return (len(soups), run)
+
+@benchmark('scrape.venues')
+def _(suite):
+
+	sc = next(iter(suite.creators.values()))
+	soups = [sc._soup(url, 'infobox') for url in suite.venue_pages]
+
+	return (len(soups), lambda: [sc._scrape_venues(soup) for soup in soups])
+
+@benchmark('source.api')
+def _(suite):
+
+	# pages and their metadata through the API source, from the stand-in serving the recorded fixtures
+	standin = load_script('mediawiki_standin', 'mediawiki-standin.py')
+	server = standin.serve(os.path.join(suite.fixture_dir, 'api.json'))
+
+	api = adb.APISource(server.api_url, adb.HTTPFetcher(rate=1e6, burst=1e6))
+	pages = adb.PageCache(cache_dir=tempfile.mkdtemp(prefix='bench-pages-'), fetcher=api)
+	urls = [url for _, url in suite.team_pages] + suite.venue_pages
+
+	def run():
+		pages.page_info(urls)
+		return [api.fetch(url) for url in urls]
+
+	def close():
+		server.shutdown()
+		server.server_close()
+
+	return (len(urls), run, close)
+
+@benchmark('source.dump')
+def _(suite):
+
+	# pages read from the fixture dump; a build from it has to come out the same as one from the fixtures
+	dump = adb.DumpSource(os.path.join(suite.fixture_dir, FIXTURE_DUMP), 
+							index_path=os.path.join(tempfile.mkdtemp(prefix='bench-dump-'), 'index.json'), max_streams=2)
+
+	if suite.build(dump) != suite.build(suite.source):
+		raise Exception(f'a build from {FIXTURE_DUMP} differs from one from the fixtures, run with --write-dump?')
+
+	urls = [url for _, url in suite.team_pages] + suite.venue_pages
+
+	return (len(urls), lambda: [dump.fetch(url) for url in urls])
+
+@benchmark('normalise.cold')
+def _(suite):
+
+	strings = suite.suburb_names[:2000]
+
+	# straight to the normaliser, i.e. bypassing the cache
+	return (len(strings), lambda: [adb.tn.normaliser.normalise(st) for st in strings])
+
+@benchmark('teg.compile')
+def _(suite):
+
+	return (len(suite.teg_venues), lambda: adb.TEGCodeFinder.from_data(suite.aus_suburbs, suite.teg_venues))
+
+@benchmark('teg.find_state_by_suburb')
+def _(suite):
+
+	rnd = random.Random(suite.seed)
+	tcf = suite.tcf
+
+	# suburbs inside longer location strings, like in venue infoboxes, and some with no suburb at all
+	locations = [adb.tn.normalise(f'{rnd.randint(1, 300)} {rnd.choice(suite.suburb_names)} road {rnd.choice(suite.suburb_names)}')
+					for _ in range(1000)] + [adb.tn.normalise(f'unknown place {i}') for i in range(200)]
+
+	return (len(locations), lambda: [tcf._find_state_by_suburb(loc) for loc in locations])
+
+@benchmark('teg.find_teg_code')
+def _(suite):
+
+	rnd = random.Random(suite.seed)
+	tcf = suite.tcf
+
+	records = suite.venue_records() + [{'name': adb.tn.normalise(f'{rnd.choice(suite.suburb_names)} oval'),
+										'location': f'{rnd.choice(suite.suburb_names)}, {rnd.choice(["nsw", "victoria", "qld"])}',
+										'wiki_url': 'https://en.wikipedia.org/wiki/Oval_' + str(i),
+										'known_as': [f'{rnd.choice(suite.suburb_names)} park']} for i in range(500)]
+
+	return (len(records), lambda: [tcf.find_teg_code(r) for r in records])
+
+def _team_strings(suite, n=50):
+
+	rnd = random.Random(suite.seed)
+
+	teams = sorted({t for sport in suite.creators.values() for t in sport.team_urls[sport.sport]})
+
+	def typo(t):
+		i = rnd.randrange(len(t))
+		return t[:i] + rnd.choice('abcdefghijklmnopqrstuvwxyz') + t[i+1:]
+
+	strings = []
+
+	for i in range(n):
+		words = [rnd.choice(suite.suburb_names) for _ in range(rnd.randint(3, 8))]
+		if i % 3 < 2:
+			words.insert(rnd.randrange(len(words)), teams[i % len(teams)] if i % 3 == 0 else typo(teams[i % len(teams)]))
+		strings.append(' '.join(words))
+
+	return (set(teams), strings)
+
+@benchmark('match.find_team')
+def _(suite):
+
+	tnm = load_script('team_name_matcher', 'team-name-matcher.py')
+	teams, strings = _team_strings(suite)
+
+	return (len(strings), lambda: [tnm.find_team(teams, st) for st in strings])
+
+@benchmark('match.team_matcher')
+def _(suite):
+
+	tnm = load_script('team_name_matcher', 'team-name-matcher.py')
+	teams, strings = _team_strings(suite)
+	matcher = tnm.TeamMatcher(teams)
+
+	return (len(strings), lambda: [matcher.match(st) for st in strings])
+
+
+def run(suite, names, repeat=5, min_time=0.2):
+
+	results = {}
+
+	for name in names:
+
+		items, fn, *close = BENCHMARKS[name](suite)
+
+		try:
+
+			# first call loads lazy modules, builds the colour palette etc.
+			fn()
+
+			timer = timeit.Timer(fn, timer=time.perf_counter)
+			number, _ = timer.autorange() if min_time else (1, None)
+			number = max(1, int(number*min_time/0.2))
+
+			per_call = [t/number for t in timer.repeat(repeat=repeat, number=number)]
+
+		finally:
+			for c in close:
+				c()
+
+		results[name] = {'items': items, 'number': number, 'repeat': repeat,
+							'min': min(per_call), 'median': statistics.median(per_call), 'max': max(per_call)}
+
+		print(f'{name:<30} {results[name]["min"]*1e3:10.3f} ms {results[name]["median"]*1e3:10.3f} ms'
+				f' {results[name]["min"]/items*1e6:12.1f} us/item')
+
+	return results
+
+def git_commit():
+
+	try:
+		commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+		dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=HERE,
+										capture_output=True, text=True, check=True).stdout.strip())
+	except (OSError, subprocess.CalledProcessError):
+		return (None, None)
+
+	return (commit, dirty)
+
+def compare(baseline, current, tolerance):
+
+	'''
+	prints how each benchmark did against baseline (by the fastest repeat, the least noisy number) and
+	returns names of those that got slower by more than tolerance
+	'''
+
+	slower = []
+
+	print(f'\n{"benchmark":<30} {"baseline":>12} {"current":>12} {"ratio":>8}')
+
+	for name in sorted(set(baseline['benchmarks']) & set(current['benchmarks'])):
+
+		old = baseline['benchmarks'][name]['min']/baseline['benchmarks'][name]['items']
+		new = current['benchmarks'][name]['min']/current['benchmarks'][name]['items']
+
+		flag = ''
+
+		if new > old*(1 + tolerance):
+			slower.append(name)
+			flag = '  SLOWER'
+		elif new < old/(1 + tolerance):
+			flag = '  faster'
+
+		print(f'{name:<30} {old*1e6:9.1f} us {new*1e6:9.1f} us {new/old:8.2f}{flag}')
+
+	return slower
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='time scrapers and matchers on recorded pages, no network needed')
+	parser.add_argument('benchmarks', nargs='*', default=['*'], help='names or patterns of benchmarks to run, e.g. scrape.*')
+	parser.add_argument('--fixtures', default='data/fixtures', help='fixture directory with fixtures.json')
+	parser.add_argument('--repeat', type=int, default=5, help='timed repeats of each benchmark')
+	parser.add_argument('--min-time', type=float, default=0.2, help='seconds each repeat should take at least')
+	parser.add_argument('--out', help='results json, by default data_cache/benchmarks/<commit>.json')
+	parser.add_argument('--compare', metavar='BASELINE', help='results json of an earlier run to compare with')
+	parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown relative to baseline that counts as a regression')
+	parser.add_argument('--list', action='store_true', help='list benchmarks and exit')
+	parser.add_argument('--write-dump', action='store_true', help=f'write the recorded pages into {FIXTURE_DUMP} in the fixture directory and exit')
+	args = parser.parse_args()
+
+	names = [name for name in BENCHMARKS if any(fnmatch.fnmatch(name, p) for p in args.benchmarks)]
+
+	if args.list:
+		print('\n'.join(names))
+		sys.exit()
+
+	if not names:
+		parser.error('no benchmarks match ' + ' '.join(args.benchmarks))
+
+	# SportDBCreator expects to find data/ in the working directory
+	os.chdir(HERE)
+
+	if args.write_dump:
+		write_fixture_dump(args.fixtures)
+		sys.exit()
+
+	commit, dirty = git_commit()
+
+	print(f'{"benchmark":<30} {"min":>13} {"median":>13} {"per item (min)":>18}')
+
+	results = {'commit': commit, 'dirty': dirty, 'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+				'python': platform.python_version(), 'platform': platform.platform(),
+					'benchmarks': run(Suite(args.fixtures), names, repeat=args.repeat, min_time=args.min_time)}
+
+	out = args.out or os.path.join('data_cache', 'benchmarks', (commit or 'nocommit')[:12] + ('-dirty' if dirty else '') + '.json')
+
+	if not os.path.isdir(os.path.dirname(out) or '.'):
+		os.makedirs(os.path.dirname(out))
+
+	json.dump(results, open(out, 'w'), indent=2)
+
+	print(f'results saved to {out}')
+
+	if args.compare:
+		if compare(json.load(open(args.compare, 'r')), results, args.tolerance):
+			sys.exit(1)
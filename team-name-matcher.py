@@ -2,8 +2,14 @@ import json
 import tnormaliser
 import pandas as pd
 import jellyfish
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import itertools
+import csv
+import sys
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import enchant
 d = enchant.Dict("en_US")
 
@@ -80,4 +86,317 @@ def find_team(cands, st, m=None):
         find_team(cands, st, m)
     
     return m if m else None
-        
\ No newline at end of file
+        
+
+class BKTree:
+    """
+    metric tree over strings under levenshtein distance: finds everything within distance k 
+    of a query without comparing the query to every item
+    """
+
+    def __init__(self, items=()):
+
+        self.root = None    # [item, {distance to item: child node}]
+
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+
+        if self.root is None:
+            self.root = [item, {}]
+            return
+
+        node = self.root
+
+        while True:
+
+            dist = jellyfish.levenshtein_distance(item, node[0])
+
+            if not dist:
+                return
+
+            if dist not in node[1]:
+                node[1][dist] = [item, {}]
+                return
+
+            node = node[1][dist]
+
+    def search(self, q, k):
+        """
+        returns [(distance, item),..] for all items within distance k of q
+        """
+
+        found = []
+        nodes = [self.root] if self.root else []
+
+        while nodes:
+
+            item, children = nodes.pop()
+            dist = jellyfish.levenshtein_distance(q, item)
+
+            if dist <= k:
+                found.append((dist, item))
+
+            # by the triangle inequality, only these subtrees can have items within k of q
+            for child_dist, child in children.items():
+                if dist - k <= child_dist <= dist + k:
+                    nodes.append(child)
+
+        return found
+
+
+class TeamMatcher:
+    """
+    precompiled version of find_team: candidate variants for every recursion level are 
+    expanded once so that matching a string only builds its n-grams and does set lookups. 
+    there is one BK-tree per recursion level, over the candidates left when nothing has been 
+    matched; candidates removed by earlier matches are filtered out at query time
+    """
+
+    def __init__(self, cands, max_levels=256):
+
+        self.max_levels = max_levels
+
+        self._next_levels = OrderedDict()   # LRU {(candidates, removed candidates): next level}
+        self._trees = {}        # {depth: (BKTree, its candidates)}
+        self._variants = {}     # {candidate: reduced variants}
+        self._words = {}        # cached enchant dictionary checks
+
+        self.root = self._level(frozenset(cands), 0)
+
+        # expand the chain of levels for the case when nothing matches in advance; 
+        # this also builds the trees, as these levels are the first to reach each depth
+        level = self.root
+        while level['cands'] and (level['n'] > 1):
+            level = self._next(level, frozenset())
+
+    def _is_word(self, w):
+
+        if w not in self._words:
+            self._words[w] = d.check(w)
+
+        return self._words[w]
+
+    def _level(self, cands, depth):
+
+        n = max((len(c.split()) for c in cands), default=0)
+
+        if depth not in self._trees:
+            self._trees[depth] = (BKTree(sorted(cands)), cands)
+
+        tree, in_tree = self._trees[depth]
+
+        # 'extra' are candidates the tree doesn't have, e.g. variants of a level reduced at a smaller n 
+        # because its longest candidates were matched; there are few of them and they are checked one by one
+        return {'n': n, 'cands': cands, 'depth': depth, 'tree': tree, 'extra': sorted(cands - in_tree),
+                    'longest': {c for c in cands if len(c.split()) == n}, 'unmatched': None}
+
+    def _reduce(self, c, n):
+
+        if c not in self._variants:
+
+            if n == 2:
+                self._variants[c] = {v for v in c.split() if not self._is_word(v)}
+            else:
+                self._variants[c] = {' '.join(cm) for cm in itertools.combinations(c.split(), n - 1)} | {''.join([x[0] for x in c.split()])}
+
+        return self._variants[c]
+
+    def _next(self, level, removed):
+
+        # next levels depend on which candidates have been matched (and removed) on this one. the 
+        # level after nothing was matched is kept with the level itself, the others in a bounded LRU
+        if (not removed) and level['unmatched']:
+            return level['unmatched']
+
+        key = (level['cands'], removed)
+
+        if key in self._next_levels:
+            self._next_levels.move_to_end(key)
+            return self._next_levels[key]
+
+        new_cands = set()
+
+        for c in level['longest'] - removed:
+            new_cands |= self._reduce(c, level['n'])
+
+        next_level = self._level(frozenset((level['cands'] - removed - level['longest']) | new_cands), level['depth'] + 1)
+
+        if not removed:
+            level['unmatched'] = next_level
+            return next_level
+
+        self._next_levels[key] = next_level
+
+        if len(self._next_levels) > self.max_levels:
+            self._next_levels.popitem(last=False)
+
+        return next_level
+
+    def match(self, st):
+
+        m = set()
+        level = self.root
+
+        while level['cands']:
+
+            n = level['n']
+            words = st.split()
+
+            if (not n) or (not words) or (n > len(words)):
+                break
+
+            possible_matches = {' '.join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+            cands_to_remove = set()
+            pms_to_remove = set()
+
+            for team in level['cands'] & possible_matches:
+
+                m.add(team)
+
+                if len(m) > 1:
+                    return m
+
+                cands_to_remove.add(team)
+                pms_to_remove.add(team)
+
+                st = ' '.join(st.replace(team, ' ').split())
+
+            cands = level['cands'] - cands_to_remove
+            possible_matches = possible_matches - pms_to_remove
+
+            # candidates within distance 2 of each possible match; the tree may have candidates that aren't on this level
+            near = [(dist, team, pm) for pm in possible_matches for dist, team in level['tree'].search(pm, 2) if dist and (team in cands)]
+            near += [(dist, team, pm) for pm in possible_matches for team in level['extra'] if team in cands 
+                        for dist in [jellyfish.levenshtein_distance(team, pm)] if 0 < dist <= 2]
+            near.sort()
+
+            for lev in range(1, 3):
+
+                for dist, team, pm in near:
+                    if (dist == lev) and (team in cands) and (pm in possible_matches):
+                        m.add(team)
+
+                        if len(m) > 1:
+                            return m
+
+                        cands_to_remove.add(team)
+                        pms_to_remove.add(pm)
+
+                cands = cands - cands_to_remove
+                possible_matches = possible_matches - pms_to_remove
+
+            if n == 1:
+                break
+
+            level = self._next(level, frozenset(cands_to_remove))
+
+        return m if m else None
+
+
+# each worker process builds its own matcher once, in _init_worker
+_matcher = None
+
+def _init_worker(cands):
+
+    global _matcher
+    _matcher = TeamMatcher(cands)
+
+def _match_chunk(strings):
+
+    return [_matcher.match(st) if isinstance(st, str) else None for st in strings]
+
+def chunked(strings, chunksize):
+
+    chunk = []
+
+    for st in strings:
+        chunk.append(st)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+def read_strings(path, column=None, chunksize=10000):
+    """
+    yields chunks of strings from a column of a csv or parquet file or, if path is -, lines from stdin
+    """
+
+    if path == '-':
+        yield from chunked((line.rstrip('\n') for line in sys.stdin), chunksize)
+    elif path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=[column]):
+            yield batch.column(0).to_pylist()
+    else:
+        for chunk in pd.read_csv(path, usecols=[column], chunksize=chunksize):
+            yield chunk[column].tolist()
+
+def match_strings(cands, chunks, out_path, workers=None, max_pending=None, report_every=10):
+    """
+    matches chunks of strings against cands on a process pool and appends (string, teams) rows 
+    to the csv file out_path as soon as each chunk is done, in input order; returns the number of rows
+    """
+
+    cands = set(cands)
+    max_pending = max_pending or 2*(workers or 4)
+
+    n_rows = 0
+    n_chunks = 0
+    t0 = time.time()
+
+    with open(out_path, 'w', newline='') as f, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cands,)) as ex:
+
+        w = csv.writer(f)
+        w.writerow(['string', 'teams'])
+
+        pending = deque()   # (chunk, future) in submission order
+        chunks = iter(chunks)
+
+        while True:
+
+            # keep a bounded number of chunks in flight so that memory stays flat
+            for chunk in itertools.islice(chunks, max_pending - len(pending)):
+                pending.append((chunk, ex.submit(_match_chunk, chunk)))
+
+            if not pending:
+                break
+
+            chunk, fut = pending.popleft()
+
+            for st, m in zip(chunk, fut.result()):
+                w.writerow([st, ';'.join(sorted(m)) if m else ''])
+
+            n_rows += len(chunk)
+            n_chunks += 1
+
+            if n_chunks % report_every == 0:
+                f.flush()
+                print(f'{n_rows:,} strings matched, {n_rows/(time.time() - t0):,.0f} strings/s')
+
+    print(f'done: {n_rows:,} strings matched in {time.time() - t0:.1f}s ({n_rows/max(time.time() - t0, 1e-9):,.0f} strings/s)')
+
+    return n_rows
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='tag strings with the team names they mention')
+    parser.add_argument('input', help='csv or parquet file, or - to read lines from stdin')
+    parser.add_argument('--column', help='column with the strings to match')
+    parser.add_argument('--out', default='team-matches.csv', help='output csv file')
+    parser.add_argument('--teams', default='data/team-wiki-urls.json', help='json file with team names as in data/team-wiki-urls.json')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of cores)')
+    parser.add_argument('--chunksize', type=int, default=10000, help='strings per chunk sent to a worker')
+    args = parser.parse_args()
+
+    if (args.input != '-') and (not args.column):
+        parser.error('--column is required for csv and parquet input')
+
+    cands = {team for sport, teams in json.load(open(args.teams, 'r')).items() for team in teams}
+
+    match_strings(cands, read_strings(args.input, args.column, args.chunksize), args.out, workers=args.workers)